@@ -0,0 +1,63 @@
+"""Running benchmark cases and comparing their results with a baseline, shared by the benchmarks in this directory.
+
+A benchmark runs itself with '--case' and a case as JSON in a child process for every run, and prints the
+case's results as JSON: at least a 'seconds' dictionary with the time of each phase and a 'peak_rss'."""
+
+from pathlib import Path
+import json, resource, subprocess, sys
+
+# changes smaller than these are timer and allocator noise, whatever the percentage
+MIN_SECONDS = .01
+MIN_BYTES = 4194304
+
+def peak_rss() -> int:
+	"""Return the peak memory of this process in bytes."""
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+def run_cases(benchmark : Path, cases : dict, repeat : int, phases : list) -> dict:
+	"""Run each case repeat times, each in a child process running benchmark with '--case', so the peak memory
+	belongs to that case only. The cases take turns, so a slow spell of the machine doesn't hit every run of
+	the same case. Keeps the fastest time of each phase (and the slowest, to tell how noisy they were) and
+	the highest peak RSS, leaving out cases with a run that failed."""
+	results = {}
+	failed = set()
+	for _ in range(repeat):
+		for name, case in cases.items():
+			if name in failed: continue
+			process = subprocess.run([sys.executable, str(benchmark), '--case', json.dumps(case)], capture_output=True, text=True)
+			if process.returncode:
+				print(f"\33[91m{name} failed:\33[0m\n{process.stderr}")
+				failed.add(name)
+				results.pop(name, None)
+				continue
+			run = json.loads(process.stdout)
+			result = results.get(name)
+			if result is None:
+				results[name] = run
+				run['slowest_seconds'] = dict(run['seconds'])
+			else:
+				result['seconds'] = {phase: min(result['seconds'][phase], run['seconds'][phase]) for phase in phases}
+				result['slowest_seconds'] = {phase: max(result['slowest_seconds'][phase], run['seconds'][phase]) for phase in phases}
+				result['peak_rss'] = max(result['peak_rss'], run['peak_rss'])
+	return results
+
+def compare_change(name : str, value : float, baseline_value : float, threshold : float, floor : float, show : bool = True, baseline_slowest : float = None) -> bool:
+	"""Print how much a measurement changed from the baseline, returning whether it is a regression: worse by
+	more than threshold percent, by more than floor (so noise on tiny measurements doesn't count), and
+	worse than the slowest run of the baseline if it's known (so a noisy machine doesn't count either)."""
+	if not baseline_value: return False
+	change = (value / baseline_value - 1) * 100
+	regression = change > threshold and value - baseline_value > floor and value > (baseline_slowest or 0)
+	if regression: print(f"\33[91m  {name:<40}{change:+8.1f}%\33[0m")
+	elif show: print(f"  {name:<40}{change:+8.1f}%")
+	return regression
+
+def compare_cases(cases : dict, baseline_cases : dict, phases : list, threshold : float, min_seconds : float = MIN_SECONDS, min_bytes : int = MIN_BYTES) -> int:
+	"""Compare the time of each phase and the peak memory of cases with a baseline, returning the number of regressions."""
+	regressions = 0
+	for name, result in cases.items():
+		if name not in baseline_cases: continue
+		baseline_slowest = baseline_cases[name].get('slowest_seconds', {})
+		for phase in phases: regressions += compare_change(f"{name} {phase}", result['seconds'][phase], baseline_cases[name]['seconds'].get(phase), threshold, min_seconds, baseline_slowest=baseline_slowest.get(phase))
+		regressions += compare_change(f"{name} peak RSS", result['peak_rss'], baseline_cases[name]['peak_rss'], threshold, min_bytes, False)
+	return regressions
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""Benchmark opendocument-cleanup.py on synthetic OpenDocument Text files.
+
+Run this file as a script (see '--help')."""
+
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from math import log
+from pathlib import Path
+from time import perf_counter
+from benchmark_harness import MIN_BYTES, MIN_SECONDS, compare_cases, peak_rss, run_cases
+import importlib.util, json, platform, random, zipfile
+
+PHASES = ['strip', 'orphans', 'empty', 'merge', 'media', 'body', 'save']
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore et dolore magna aliqua".split()
+NAMESPACES = ' '.join(f'xmlns:{prefix}="{uri}"' for prefix, uri in (
+	('office', 'urn:oasis:names:tc:opendocument:xmlns:office:1.0'),
+	('style', 'urn:oasis:names:tc:opendocument:xmlns:style:1.0'),
+	('text', 'urn:oasis:names:tc:opendocument:xmlns:text:1.0'),
+	('draw', 'urn:oasis:names:tc:opendocument:xmlns:drawing:1.0'),
+	('fo', 'urn:oasis:names:tc:opendocument:xmlns:xsl-fo-compatible:1.0'),
+	('xlink', 'http://www.w3.org/1999/xlink'),
+	('svg', 'urn:oasis:names:tc:opendocument:xmlns:svg-compatible:1.0'),
+	('loext', 'urn:org:documentfoundation:names:experimental:office:xmlns:loext:1.0'),
+	('officeooo', 'http://openoffice.org/2009/office'),
+))
+
+def load_cleanup(path : Path):
+	"""Import opendocument-cleanup.py as a module (its name has a dash in it, so it can't be imported normally)."""
+	spec = importlib.util.spec_from_file_location('opendocument_cleanup', path)
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+def generate_styles(generator : random.Random, styles : int, duplicates : float, rsids : float) -> tuple:
+	"""Make the automatic styles of a document, returning them with the names the body may use.
+
+	A quarter of the styles are text styles, some of them empty once rsids are removed, and a
+	twentieth are list styles. Of the rest, a tenth only name a parent, a share set by duplicates are
+	copies of earlier styles, and the last tenth of every kind is never used."""
+	def rsid() -> str:
+		return f' officeooo:rsid="{generator.randrange(16 ** 8):08x}" officeooo:paragraph-rsid="{generator.randrange(16 ** 8):08x}"' if generator.random() < rsids else ''
+	parts = []
+	used = {'P': [], 'T': [], 'L': []}
+	counts = {'P': styles - styles // 4 - styles // 20, 'T': styles // 4, 'L': styles // 20}
+	properties = []
+	for kind, count in counts.items():
+		for index in range(count):
+			name = f'{kind}{index + 1}'
+			if index < count * .9: used[kind].append(name)
+			if kind == 'P':
+				if properties and generator.random() < .1: parts.append(f'<style:style style:name="{name}" style:family="paragraph" style:parent-style-name="P{generator.randrange(1, index + 1)}"/>')
+				else:
+					if properties and generator.random() < duplicates: margin, size = generator.choice(properties)
+					else:
+						margin, size = generator.randrange(100), generator.randrange(8, 30)
+						properties.append((margin, size))
+					parts.append(f'<style:style style:name="{name}" style:family="paragraph" style:parent-style-name="Standard"><style:paragraph-properties fo:margin-top="0.{margin:02}in" loext:opacity="100%"/><style:text-properties fo:font-size="{size}pt"{rsid()} style:font-name="Liberation Serif" style:language-asian="zh" style:country-asian="CN"/></style:style>')
+			elif kind == 'T':
+				weight = '' if index % 2 else ' fo:font-weight="bold"'
+				parts.append(f'<style:style style:name="{name}" style:family="text"><style:text-properties{weight}{rsid()}/></style:style>')
+			else:
+				bullet = '•◦▪'[index % 3] if generator.random() < duplicates else '•◦▪-+*'[generator.randrange(6)] + str(index)
+				parts.append(f'<text:list-style style:name="{name}"><text:list-level-style-bullet text:level="1" text:bullet-char="{bullet}"><style:list-level-properties text:list-level-position-and-space-mode="label-alignment"/></text:list-level-style-bullet></text:list-style>')
+	return ''.join(parts), used
+
+def generate_document(path : Path, paragraphs : int, styles : int, duplicates : float, rsids : float, images : int, image_size : int):
+	"""Write an OpenDocument Text file with the given amount of everything the cleanup removes, the same every time for the same settings."""
+	generator = random.Random(f"{paragraphs}-{styles}-{duplicates}-{rsids}-{images}-{image_size}")
+	automatic_styles, used = generate_styles(generator, styles, duplicates, rsids)
+	# half of the images are copies of the other half
+	pictures = [generator.randbytes(image_size) for _ in range((images + 1) // 2)]
+	date_time = (2020, 1, 1, 0, 0, 0)
+	def info(name : str, compress_type=zipfile.ZIP_DEFLATED) -> zipfile.ZipInfo:
+		item = zipfile.ZipInfo(name, date_time)
+		item.compress_type = compress_type
+		return item
+	with zipfile.ZipFile(path, 'w') as doc:
+		doc.writestr(info('mimetype', zipfile.ZIP_STORED), 'application/vnd.oasis.opendocument.text')
+		with doc.open(info('content.xml'), 'w') as content:
+			content.write(f'<?xml version="1.0" encoding="UTF-8"?>\n<office:document-content {NAMESPACES} office:version="1.3"><office:font-face-decls><style:font-face style:name="Liberation Serif" svg:font-family="&apos;Liberation Serif&apos;" style:font-family-generic="roman" style:font-pitch="variable"/></office:font-face-decls><office:automatic-styles>{automatic_styles}<style:style style:name="fr1" style:family="graphic" style:parent-style-name="Graphics"/></office:automatic-styles><office:body><office:text>'.encode())
+			parts = []
+			for index in range(paragraphs):
+				words = generator.choices(WORDS, k=12)
+				if used['T'] and generator.random() < .5:
+					words[6] = f'<text:span text:style-name="{generator.choice(used["T"])}">{words[6]}</text:span>'
+				if images and index % max(1, paragraphs // images) == 0 and index // max(1, paragraphs // images) < images:
+					number = index // max(1, paragraphs // images)
+					words.append(f'<draw:frame draw:style-name="fr1" draw:name="Image{number + 1}" text:anchor-type="as-char" svg:width="1in" svg:height="1in" draw:z-index="{number}"><draw:image xlink:href="Pictures/{number:04}.png" xlink:type="simple" xlink:show="embed" xlink:actuate="onLoad" draw:mime-type="image/png"/></draw:frame>')
+				paragraph = f'<text:p text:style-name="{generator.choice(used["P"])}">{" ".join(words)}</text:p>'
+				if used['L'] and index % 10 == 0: paragraph = f'<text:list text:style-name="{generator.choice(used["L"])}"><text:list-item>{paragraph}</text:list-item></text:list>'
+				parts.append(paragraph)
+				if len(parts) == 1000:
+					content.write(''.join(parts).encode())
+					parts = []
+			content.write((''.join(parts) + '</office:text></office:body></office:document-content>').encode())
+		doc.writestr(info('styles.xml'), f'<?xml version="1.0" encoding="UTF-8"?>\n<office:document-styles {NAMESPACES} office:version="1.3"><office:styles><style:style style:name="Standard" style:family="paragraph" style:class="text"/><style:style style:name="Graphics" style:family="graphic"/></office:styles></office:document-styles>')
+		entries = ''.join(f'<manifest:file-entry manifest:full-path="Pictures/{number:04}.png" manifest:media-type="image/png"/>' for number in range(images))
+		doc.writestr(info('META-INF/manifest.xml'), f'<?xml version="1.0" encoding="UTF-8"?>\n<manifest:manifest xmlns:manifest="urn:oasis:names:tc:opendocument:xmlns:manifest:1.0" manifest:version="1.3"><manifest:file-entry manifest:full-path="/" manifest:media-type="application/vnd.oasis.opendocument.text"/><manifest:file-entry manifest:full-path="content.xml" manifest:media-type="text/xml"/><manifest:file-entry manifest:full-path="styles.xml" manifest:media-type="text/xml"/>{entries}</manifest:manifest>')
+		for number in range(images): doc.writestr(info(f'Pictures/{number:04}.png', zipfile.ZIP_STORED), pictures[number % len(pictures)])
+
+def run_case(case : dict) -> dict:
+	"""Time each phase of cleaning one document, running the phases of ContentCleaner.scan one at a time."""
+	cleanup = load_cleanup(Path(case['script']))
+	path = Path(case['path'])
+	results = {}
+	cleaner = cleanup.ContentCleaner()
+	with zipfile.ZipFile(path) as doc:
+		# read content.xml, stripping attributes and counting references in the body
+		start_time = perf_counter()
+		with doc.open('content.xml') as member: stats = cleaner.read(member)
+		results['strip'] = perf_counter() - start_time
+
+		for phase, run in (('orphans', cleaner.remove_orphans), ('empty', cleaner.collapse_empty), ('merge', cleaner.merge_identical)):
+			start_time = perf_counter()
+			run()
+			results[phase] = perf_counter() - start_time
+
+		start_time = perf_counter()
+		duplicates = cleanup.find_duplicate_media(doc)
+		stats.duplicate_media = len(duplicates)
+		results['media'] = perf_counter() - start_time
+
+		# write the cleaned document, timing the body pass of ContentCleaner.clean apart from the zip writing around it
+		clean = cleaner.clean
+		body_seconds = 0.0
+		def timed_clean(*arguments):
+			nonlocal body_seconds
+			pieces = clean(*arguments)
+			while True:
+				start_time = perf_counter()
+				piece = next(pieces, None)
+				body_seconds += perf_counter() - start_time
+				if piece is None: return
+				yield piece
+		cleaner.clean = timed_clean
+		temp_path = path.with_name(path.name + '.tmp')
+		start_time = perf_counter()
+		with zipfile.ZipFile(temp_path, 'w') as temp_doc: cleanup.write_document(doc, temp_doc, cleaner, duplicates)
+		results['body'] = body_seconds
+		results['save'] = perf_counter() - start_time - body_seconds
+	size = temp_path.stat().st_size
+	temp_path.unlink()
+
+	return {
+		'size': path.stat().st_size,
+		'cleaned_size': size,
+		'removed': {'attributes': sum(stats.attributes), 'orphan_styles': stats.orphan_styles + stats.orphan_list_styles, 'empty_styles': stats.empty_styles, 'duplicate_styles': stats.duplicate_styles + stats.duplicate_list_styles, 'duplicate_media': stats.duplicate_media},
+		'seconds': results,
+		'peak_rss': peak_rss()
+	}
+
+def exponent(points : list):
+	"""Fit time = a * count ^ exponent to (count, seconds) points, returning the exponent (None if there aren't enough usable points)."""
+	# below about 10ms, timer noise and fixed costs swamp the curve
+	if not points or max(seconds for count, seconds in points) < MIN_SECONDS: return None
+	points = [(log(count), log(seconds)) for count, seconds in points if count > 0 and seconds > 0]
+	if len(points) < 2: return None
+	mean_x = sum(x for x, y in points) / len(points)
+	mean_y = sum(y for x, y in points) / len(points)
+	variance = sum((x - mean_x) ** 2 for x, y in points)
+	return sum((x - mean_x) * (y - mean_y) for x, y in points) / variance if variance else None
+
+def scaling(cases : dict) -> dict:
+	"""Scaling exponent of each phase over paragraphs (at the largest style count) and over styles (at the largest paragraph count)."""
+	curves = {}
+	for axis, fixed in (('paragraphs', 'styles'), ('styles', 'paragraphs')):
+		if not cases: break
+		largest = max(case[fixed] for case in cases.values())
+		points = sorted((case[axis], case['seconds']) for case in cases.values() if case[fixed] == largest)
+		curves[axis] = {phase: exponent([(count, seconds[phase]) for count, seconds in points]) for phase in PHASES}
+	return curves
+
+def format_exponent(value) -> str:
+	return f"{value:8.2f}" if value is not None else "       -"
+
+if __name__ == '__main__':
+	# parse arguments
+	parser = ArgumentParser(
+		description="Benchmarks the phases of opendocument-cleanup.py on synthetic OpenDocument Text files. The files are generated deterministically, so results from different runs (or different versions of the script) can be compared directly.",
+		epilog="""
+phases:
+  strip     reading content.xml, removing rsids and other attributes, and counting style references
+  orphans   removing styles nothing refers to
+  empty     replacing empty styles with their parents and unwrapping empty spans
+  merge     merging identical styles and list styles
+  media     finding identical images
+  body      cleaning the body on the way through: reading it again and rewriting references and spans
+  save      writing the cleaned document, apart from the body
+
+Every combination of paragraph and style counts is a case. The scaling exponents printed at the end
+show how each phase grows with the number of paragraphs and of styles (1 is linear, 2 quadratic),
+which catches algorithmic regressions that small cases are too fast to show.
+
+Each case runs in its own process so that the peak memory reported belongs to that case only.
+Generated files are kept in the work directory and reused by later runs.
+""",
+		formatter_class=RawDescriptionHelpFormatter
+	)
+	parser.add_argument("-p", "--paragraphs", type=int, nargs='+', default=[1000, 10000, 100000], help="paragraph counts to test (default: 1000 10000 100000)")
+	parser.add_argument("-s", "--styles", type=int, nargs='+', default=[100, 1000, 10000], help="automatic style counts to test (default: 100 1000 10000)")
+	parser.add_argument("--duplicates", type=float, default=.3, help="fraction of styles that are copies of another style once rsids are removed (default: 0.3)")
+	parser.add_argument("--rsids", type=float, default=1, help="fraction of styles with rsid attributes (default: 1)")
+	parser.add_argument("-i", "--images", type=int, default=20, help="number of embedded images, half of them copies of the others (default: 20)")
+	parser.add_argument("--image-size", type=int, default=65536, help="size of each image in bytes (default: 65536)")
+	parser.add_argument("--repeat", type=int, default=5, help="how many times to run each case, keeping the fastest time of each phase (default: 5)")
+	parser.add_argument("--work-dir", type=Path, default=Path('opendocument-cleanup-benchmark'), help="where generated files are kept (default: ./opendocument-cleanup-benchmark)")
+	parser.add_argument("--script", type=Path, default=Path(__file__).with_name('opendocument-cleanup.py'), help="the opendocument-cleanup.py to benchmark (default: the one next to this script)")
+	parser.add_argument("-o", "--output", type=Path, help="save the results to this file as JSON")
+	parser.add_argument("--compare", type=Path, metavar='BASELINE', help="compare against results saved earlier with --output, and exit with status 1 if any phase got slower than the threshold")
+	parser.add_argument("--threshold", type=float, default=10, help=f"how many percent slower a phase may get before it counts as a regression, which it also has to by at least {MIN_SECONDS * 1000:g}ms (or {MIN_BYTES // 1048576}MB for peak memory), and be slower than every run of it in the baseline (default: 10)")
+	parser.add_argument("--exponent-threshold", type=float, default=.25, help="how much a scaling exponent may grow before it counts as a regression (default: 0.25)")
+	parser.add_argument("--case", help="run a single case given as JSON and print its results (used internally)")
+	args = parser.parse_args()
+
+	# run a single case (in a child process)
+	if args.case:
+		print(json.dumps(run_case(json.loads(args.case))))
+		exit()
+
+	args.work_dir.mkdir(parents=True, exist_ok=True)
+	results = {
+		'python': platform.python_version(),
+		'platform': platform.platform(),
+		'settings': {'duplicates': args.duplicates, 'rsids': args.rsids, 'images': args.images, 'image_size': args.image_size},
+		'cases': {}
+	}
+	print(f"{'case':<24}" + ''.join(f"{phase + ' ms':>12}" for phase in PHASES) + f"{'peak RSS':>12}")
+
+	cases = {}
+	sizes = {}
+	for paragraphs in args.paragraphs:
+		for styles in args.styles:
+			name = f"{paragraphs}p-{styles}s"
+			path = args.work_dir / f"{name}-{args.duplicates:g}d-{args.rsids:g}r-{args.images}i-{args.image_size}.odt"
+			if not path.exists(): generate_document(path, paragraphs, styles, args.duplicates, args.rsids, args.images, args.image_size)
+			cases[name] = {'script': str(args.script.resolve()), 'path': str(path)}
+			sizes[name] = paragraphs, styles
+
+	for name, result in run_cases(Path(__file__), cases, args.repeat, PHASES).items():
+		result['paragraphs'], result['styles'] = sizes[name]
+		results['cases'][name] = result
+		print(f"{name:<24}" + ''.join(f"{result['seconds'][phase] * 1000:>12.1f}" for phase in PHASES) + f"{result['peak_rss'] / 1048576:>10.1f}MB")
+
+	# how each phase grows with the size of the document
+	results['scaling'] = scaling(results['cases'])
+	if results['scaling']:
+		print(f"\n{'scaling exponent':<24}" + ''.join(f"{phase:>12}" for phase in PHASES))
+		for axis, exponents in results['scaling'].items():
+			print(f"{'over ' + axis:<24}" + ''.join(f"{format_exponent(exponents[phase]):>12}" for phase in PHASES))
+
+	if args.output:
+		args.output.write_text(json.dumps(results, indent='\t'))
+		print(f"\nResults saved to {args.output}.")
+
+	# compare with baseline
+	if args.compare:
+		baseline = json.loads(args.compare.read_text())
+		print(f"\nCompared with {args.compare} (time relative to baseline):")
+		regressions = compare_cases(results['cases'], baseline['cases'], PHASES, args.threshold)
+		# exponents only mean something when they were measured over the same cases
+		if set(baseline['cases']) == set(results['cases']):
+			print("Scaling exponents (change from baseline):")
+			for axis, exponents in results['scaling'].items():
+				for phase in PHASES:
+					value, baseline_value = exponents[phase], baseline.get('scaling', {}).get(axis, {}).get(phase)
+					if value is None or baseline_value is None: continue
+					if value - baseline_value > args.exponent_threshold:
+						regressions += 1
+						print(f"\33[91m  {phase + ' over ' + axis:<40}{value - baseline_value:+8.2f}\33[0m")
+					else: print(f"  {phase + ' over ' + axis:<40}{value - baseline_value:+8.2f}")
+		if regressions:
+			print(f"\33[91m{regressions} regressions found.\33[0m")
+			exit(1)
+		print("No regressions found.")
@@ -1,20 +1,496 @@
 #!/usr/bin/env python3
+"""Clean up unused and redundant formatting information in OpenDocument files.
+
+Run this file as a script for the command line tool (see '--help'), or load it with importlib (its
+name has a dash in it) to clean documents in memory.
+
+clean_document takes a whole document as bytes or a binary file object, and clean_content takes the
+text of a content.xml. Both return the cleaned result along with a CleanupStats of what was removed.
+The phases of the cleanup (strip_rules, remove_orphans, collapse_empty and merge_identical) are also
+functions of their own, which take the text of a content.xml and return the new text and a
+CleanupStats, without changing anything else. Running them in that order (adding up their stats with
+CleanupStats.add) gives the same result as clean_content, which streams the body with a ContentCleaner
+instead of holding it in memory."""
+
 from argparse import ArgumentParser, RawDescriptionHelpFormatter
 from os import utime
-from time import time
+from time import localtime, time
 from pathlib import Path
+from collections import Counter
+from itertools import chain
 from shutil import copystat
-import re, zipfile
+from copy import copy
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from multiprocessing import get_context
+from xml.sax.saxutils import escape
+import hashlib, io, json, os, re, zipfile
+
+# data removal rules (removed in order from the first string to the end of the last)
+RULES = [
+	([' officeooo:rsid="', '"'], "officeooo:rsid entries"),
+	([' officeooo:paragraph-rsid="', '"'], "officeooo:paragraph-rsid entries"),
+	([' loext:opacity="100%"'], "loext:opacity entries")
+]
+LANGUAGE_RULES = [
+	([' style:language', '"', '"'], "language entries"),
+	([' style:country', '"', '"'], "country entries")
+]
+FONT_RULES = [
+	(['<style:font-face', '/>'], "fonts"),
+	([' style:font-name="', '"'], "styles")
+]
+
+def make_rules(remove_fonts=False, remove_language=True, extra=()):
+	"""List the rules for the given options, each a list of strings to match and a description of what it removes."""
+	return RULES + (LANGUAGE_RULES if remove_language else []) + (FONT_RULES if remove_fonts else []) + list(extra)
+
+def read_rules(path):
+	"""Read extra rules from a JSON file (the format is described in '--help')."""
+	rules = []
+	for rule in json.loads(Path(path).read_text()):
+		strings = [rule['match']] if isinstance(rule['match'], str) else rule['match']
+		if not strings or not all(isinstance(string, str) and string for string in strings): raise ValueError(f"invalid match {rule['match']!r}")
+		rules.append((strings, rule.get('message', f"'{strings[0].strip()}' entries")))
+	return rules
+
+def compile_rules(rules : list):
+	# without rules, nothing ever matches
+	if not rules: return re.compile('(?!)')
+	# all rules are combined into one pattern, so the document is only searched once (the lookahead in front lets the search skip ahead quickly, and the last group finds rules that might end in the next chunk)
+	return re.compile('(?=' + '|'.join(re.escape(strings[0]) for strings, message in rules) + ')(?:' + '|'.join('(' + '.*?'.join(re.escape(string) for string in strings) + ')' for strings, message in rules) + '|())', re.DOTALL)
+
+# style names and references to them
+name_pattern = re.compile(r' style:name="([^"]*)"')
+reference_pattern = re.compile(r'style-name="([^"]*)"')
+# empty styles (with only a parent, or text styles with nothing at all), and everything that can refer to them
+empty_pattern = re.compile(r'<style:style style:name="(?P<empty>\w+)" style:family="[a-z]+" style:parent-style-name="(?P<parent>\w+)"(?:/|><style:text-properties/></style:style)>|<style:style style:name="(?P<empty_text>\w+)" style:family="text"(?:/|><style:text-properties/></style:style)>')
+empty_cleanup_pattern = re.compile(empty_pattern.pattern + r'|<text:span text:style-name="(?P<span>[^"]*)">|(?P<tag><text:span(?:\s[^>]*)?>)|(?P<end></text:span>)|style-name="(?P<reference>[^"]*)"')
+
+# content.xml is read in two parts: everything before the body (which holds the styles) is kept in memory, and the body is streamed in chunks
+def split_chunks(pieces):
+	# split right before a tag, so that no tag is cut in half
+	rest = ''
+	for text in pieces:
+		text = rest + text
+		split = text.rfind('<')
+		if split > 0:
+			rest = text[split:]
+			yield text[:split]
+		else: rest = text
+	if rest: yield rest
+
+def read_content(content, pattern, removed : list) -> tuple:
+	# content is a binary file or a string, and data matching the rules in pattern is removed on the way (and counted in removed)
+	if isinstance(content, str): pieces = [content]
+	else:
+		text = io.TextIOWrapper(content, encoding='utf-8')
+		pieces = iter(lambda: text.read(1048576), '')
+	chunks = split_chunks(strip_chunks(split_chunks(pieces), pattern, removed))
+	head = []
+	for chunk in chunks:
+		begin = chunk.find('<office:body')
+		if begin != -1:
+			head.append(chunk[:begin])
+			return ''.join(head), chain([chunk[begin:]], chunks)
+		head.append(chunk)
+	return ''.join(head), iter(())
+
+def copy_member(doc : zipfile.ZipFile, new_doc : zipfile.ZipFile, info : zipfile.ZipInfo):
+	# copy the compressed data of a member as it is (zipfile has no public way to do this, so the entry is added by hand)
+	doc.fp.seek(info.header_offset)
+	header = doc.fp.read(zipfile.sizeFileHeader)
+	if header[:4] != zipfile.stringFileHeader: raise zipfile.BadZipFile(f"Bad header for '{info.filename}'")
+	doc.fp.seek(info.header_offset + zipfile.sizeFileHeader + int.from_bytes(header[26:28], 'little') + int.from_bytes(header[28:30], 'little'))
+	new_info = copy(info)
+	# sizes are known, so they go in the header rather than after the data
+	new_info.flag_bits &= ~0x08
+	new_info.header_offset = new_doc.fp.tell()
+	new_doc.fp.write(new_info.FileHeader())
+	left = info.compress_size
+	while left:
+		data = doc.fp.read(min(left, 1048576))
+		if not data: raise zipfile.BadZipFile(f"'{info.filename}' is truncated")
+		new_doc.fp.write(data)
+		left -= len(data)
+	new_doc.filelist.append(new_info)
+	new_doc.NameToInfo[new_info.filename] = new_info
+	new_doc.start_dir = new_doc.fp.tell()
+	new_doc._didModify = True
+
+MEDIA = ('Pictures/', 'Media/')
+
+def find_duplicate_media(doc : zipfile.ZipFile) -> dict:
+	# only media with the same size and checksum can be identical, and those are compared by hashing them as they are read
+	candidates = {}
+	for item in doc.infolist():
+		if item.filename.startswith(MEDIA) and not item.is_dir(): candidates.setdefault((item.file_size, item.CRC), []).append(item)
+	duplicates = {}
+	for items in candidates.values():
+		if len(items) < 2: continue
+		first = {}
+		for item in items:
+			digest = hashlib.sha256()
+			with doc.open(item) as member:
+				while data := member.read(1048576): digest.update(data)
+			original = first.setdefault(digest.digest(), item.filename)
+			if original != item.filename: duplicates[item.filename] = original
+	return duplicates
+
+def get_element_end(content : str, pos : int) -> int:
+	tag_end = content.find('>', pos) + 1
+	if content[tag_end - 2] == '/': return tag_end
+	levels = 1
+	while content.find('<', pos + 1) != -1:
+		pos = content.find('<', pos + 1) + 1
+		tag_end = content.find('>', pos) + 1
+		if content[pos] == '/':
+			levels -= 1
+			if levels == 0: return tag_end
+		elif content[tag_end - 2] != '/': levels += 1
+
+def get_property(content : str, pos : int, name : str) -> str:
+	begin = content.find(name + '="', pos) + len(name) + 2
+	return content[begin : content.find('"', begin)]
+
+def strip_attributes(text : str, pattern, removed : list, final : bool = True) -> tuple:
+	# remove matches of a pattern from compile_rules, counted per rule, and unless final, text from a rule that might end in the next chunk on is returned separately (up to 16MB)
+	parts = []
+	pos = 0
+	for match in pattern.finditer(text):
+		rule = match.lastindex - 1
+		if rule == pattern.groups - 1:
+			if final or match.start() == 0 and len(text) > 16777216: continue
+			parts.append(text[pos : match.start()])
+			return ''.join(parts), text[match.start():]
+		parts.append(text[pos : match.start()])
+		pos = match.end()
+		removed[rule] += 1
+	parts.append(text[pos:])
+	return ''.join(parts), ''
+
+def strip_chunks(chunks, pattern, removed : list):
+	rest = ''
+	for chunk in chunks:
+		text, rest = strip_attributes(rest + chunk, pattern, removed, False)
+		yield text
+	yield strip_attributes(rest, pattern, removed)[0]
+
+def split_body(content : str) -> tuple:
+	# the styles are everything before the body
+	begin = content.find('<office:body')
+	return (content, '') if begin == -1 else (content[:begin], content[begin:])
+
+def strip_rules(content : str, rules=None) -> tuple:
+	"""Remove the data matching rules (by default those of make_rules) from the text of a content.xml, returning the new text and a CleanupStats."""
+	stats = CleanupStats(make_rules() if rules is None else rules)
+	return strip_attributes(content, compile_rules(stats.rules), stats.attributes)[0], stats
+
+def remove_orphans(content : str, references : Counter = None) -> tuple:
+	"""Remove the styles and list styles nothing refers to from the text of a content.xml, returning the new
+	text and a CleanupStats. If the text is only the part before the body, references has to count the
+	style references in the body instead."""
+	head, body = split_body(content)
+	references = Counter(reference_pattern.findall(body)) if references is None else references.copy()
+	# index every style definition and style reference in one pass
+	content = head
+	definitions = {'<style:style': [], '<text:list-style': []}
+	definition = None
+	for match in re.finditer(r'(<style:style|<text:list-style)[\s/>]|style-name="([^"]*)"', content):
+		if match[1]:
+			definition = (match.start(), get_element_end(content, match.start()), get_property(content, match.start(), 'style:name'), Counter())
+			definitions[match[1]].append(definition)
+		else:
+			references[match[2]] += 1
+			# remember references made by a style, so they can be dropped along with it
+			if definition and match.start() < definition[1]: definition[3][match[2]] += 1
+	# styles are checked in document order, and a removed style no longer counts as using anything
+	orphans = []
+	removed = []
+	for kind in ('<style:style', '<text:list-style'):
+		removed.append(0)
+		for begin, end, name, used in definitions[kind]:
+			if not references[name]:
+				references.subtract(used)
+				orphans.append((begin, end))
+				removed[-1] += 1
+	# remove orphans
+	if orphans:
+		orphans.sort()
+		parts = []
+		pos = 0
+		for begin, end in orphans:
+			parts.append(content[pos:begin])
+			pos = end
+		parts.append(content[pos:])
+		content = ''.join(parts)
+	stats = CleanupStats()
+	stats.orphan_styles, stats.orphan_list_styles = removed
+	return content + body, stats
+
+def clean_spans(text : str, resolve, unwrap : set, spans : list) -> str:
+	# rewrite references with resolve and unwrap spans with styles in unwrap (spans keeps track of open spans between chunks)
+	def clean(match) -> str:
+		if match['empty'] or match['empty_text']: return ''
+		if match['span'] is not None:
+			name = resolve(match['span'])
+			spans.append(name in unwrap)
+			return '' if name in unwrap else f'<text:span text:style-name="{name}">'
+		if match['tag']:
+			if not match['tag'].endswith('/>'): spans.append(False)
+			return reference_pattern.sub(lambda match: f'style-name="{resolve(match[1])}"', match['tag'])
+		if match['end']: return '' if spans and spans.pop() else match[0]
+		return f'style-name="{resolve(match["reference"])}"'
+	return empty_cleanup_pattern.sub(clean, text)
+
+def collapse_empty(content : str) -> tuple:
+	"""Replace the styles that only name a parent with the parent, and unwrap the spans with empty text styles,
+	in the text of a content.xml. Returns the new text and a CleanupStats."""
+	parents = {}
+	unwrap = set()
+	removed = 0
+	for match in empty_pattern.finditer(content):
+		if match['empty']: parents[match['empty']] = match['parent']
+		else: unwrap.add(match['empty_text'])
+		removed += 1
+	# follow chains of empty styles to the first real style
+	resolved = {}
+	def resolve(name : str) -> str:
+		if name in resolved: return resolved[name]
+		chain = []
+		while name in parents and name not in chain:
+			chain.append(name)
+			name = parents[name]
+		for link in chain: resolved[link] = name
+		return name
+	# remove styles, rewrite references and unwrap spans in one pass
+	if removed: content = clean_spans(content, resolve, unwrap, [])
+	stats = CleanupStats()
+	stats.empty_styles = removed
+	stats.renames = {name: resolve(name) for name in parents}
+	stats.unwrapped = unwrap
+	return content, stats
+
+def merge_tag(content : str, tag : str) -> tuple:
+	# find styles, keyed by everything but their name
+	styles = []
+	for match in re.finditer(tag + r'[\s/>]', content):
+		begin = match.start()
+		end = get_element_end(content, begin)
+		name = name_pattern.search(content, begin, content.find('>', begin))
+		if name: styles.append((begin, end, name[1], content[begin : name.start()] + content[name.end() : end]))
+	# styles that only differ in references to styles merged with each other are identical too, so repeat until nothing changes
+	aliases = {}
+	def resolve(name : str) -> str:
+		while name in aliases: name = aliases[name]
+		return name
+	def rename(match) -> str:
+		return f'style-name="{resolve(match[1])}"' if match[1] in aliases else match[0]
+	merged = True
+	while merged:
+		merged = False
+		first = {}
+		for begin, end, name, data in styles:
+			if name in aliases: continue
+			if aliases: data = reference_pattern.sub(rename, data)
+			if data in first:
+				aliases[name] = first[data]
+				merged = True
+			else: first[data] = name
+	if not aliases: return content, {}
+	# remove duplicates and point references at the style that was kept
+	parts = []
+	pos = 0
+	for begin, end, name, data in styles:
+		if name in aliases:
+			parts.append(reference_pattern.sub(rename, content[pos:begin]))
+			pos = end
+	parts.append(reference_pattern.sub(rename, content[pos:]))
+	return ''.join(parts), {name: resolve(name) for name in aliases}
+
+def merge_identical(content : str) -> tuple:
+	"""Merge the identical styles and list styles in the text of a content.xml, returning the new text and a CleanupStats."""
+	content, style_aliases = merge_tag(content, '<style:style')
+	content, list_aliases = merge_tag(content, '<text:list-style')
+	stats = CleanupStats()
+	stats.duplicate_styles = len(style_aliases)
+	stats.duplicate_list_styles = len(list_aliases)
+	# a reference goes through both
+	stats.renames = {**list_aliases, **{name: list_aliases.get(alias, alias) for name, alias in style_aliases.items()}}
+	return content, stats
+
+class CleanupStats:
+	"""What was removed from a document. attributes holds how many matches of each rule were removed,
+	in the same order as rules, and duplicate_media_size is the compressed size of the media removed.
+	renames maps the names of removed styles to the styles that replaced them, and unwrapped holds the
+	names of the empty text styles whose spans were unwrapped."""
+	
+	def __init__(self, rules=()):
+		self.rules = rules
+		self.attributes = [0] * len(rules)
+		self.orphan_styles = 0
+		self.orphan_list_styles = 0
+		self.empty_styles = 0
+		self.duplicate_styles = 0
+		self.duplicate_list_styles = 0
+		self.duplicate_media = 0
+		self.duplicate_media_size = 0
+		self.renames = {}
+		self.unwrapped = set()
+	
+	def add(self, stats):
+		"""Add the stats of a phase that ran after the ones counted so far."""
+		if not self.attributes: self.rules, self.attributes = stats.rules, list(stats.attributes)
+		elif stats.attributes: self.attributes = [count + added for count, added in zip(self.attributes, stats.attributes)]
+		for name in ('orphan_styles', 'orphan_list_styles', 'empty_styles', 'duplicate_styles', 'duplicate_list_styles', 'duplicate_media', 'duplicate_media_size'):
+			setattr(self, name, getattr(self, name) + getattr(stats, name))
+		# styles renamed before are renamed again if what replaced them was
+		self.renames = {**stats.renames, **{name: stats.renames.get(new, new) for name, new in self.renames.items()}}
+		self.unwrapped |= stats.unwrapped
+		return self
+	
+	@property
+	def changes(self):
+		return sum(self.attributes) + self.orphan_styles + self.orphan_list_styles + self.empty_styles + self.duplicate_styles + self.duplicate_list_styles + self.duplicate_media
+
+class ContentCleaner:
+	"""Cleans a content.xml in two passes, so that its body never has to be held in memory.
+
+	scan reads it once to clean the styles (which come before the body) and to find which of them the
+	body uses, and clean reads it again to stream the body through the same changes. Both take the same
+	content, either a binary file object (which clean needs a fresh copy of) or the text as a string.
+	The styles go through the same phase functions as a whole content.xml would, and the methods running
+	them can also be called one at a time, after read and in the same order as scan."""
+
+	def __init__(self, rules=None):
+		self.rules = make_rules() if rules is None else rules
+		self.pattern = compile_rules(self.rules)
+		self.stats = None
+
+	def scan(self, content):
+		"""Clean the styles and count what was removed, returning the CleanupStats."""
+		self.read(content)
+		self.remove_orphans()
+		self.collapse_empty()
+		self.merge_identical()
+		return self.stats
+
+	def read(self, content):
+		"""Read the styles with the rules' matches removed, and count the style references in the body."""
+		self.stats = CleanupStats(self.rules)
+		self.references = Counter()
+		self.head, body = read_content(content, self.pattern, self.stats.attributes)
+		for chunk in body: self.references.update(reference_pattern.findall(chunk))
+		return self.stats
+
+	def remove_orphans(self):
+		self.head, stats = remove_orphans(self.head, self.references)
+		return self.stats.add(stats)
+
+	def collapse_empty(self):
+		self.head, stats = collapse_empty(self.head)
+		return self.stats.add(stats)
+
+	def merge_identical(self):
+		self.head, stats = merge_identical(self.head)
+		return self.stats.add(stats)
+
+	def rename(self, name):
+		return self.stats.renames.get(name, name)
+
+	def clean(self, content, rename_media=None):
+		"""Yield the cleaned content in pieces of text, optionally passing them through rename_media as well."""
+		if self.stats is None: raise RuntimeError("the content has to be scanned before it can be cleaned")
+		yield rename_media(self.head) if rename_media else self.head
+		spans = []
+		for chunk in read_content(content, self.pattern, [0] * len(self.rules))[1]:
+			# references in the body go through every change made to the styles
+			if self.stats.renames or self.stats.unwrapped: chunk = clean_spans(chunk, self.rename, self.stats.unwrapped, spans)
+			if rename_media: chunk = rename_media(chunk)
+			yield chunk
+
+def clean_content(content, rules=None):
+	"""Clean the text of a content.xml, returning the cleaned text and the CleanupStats."""
+	cleaner = ContentCleaner(rules)
+	cleaner.scan(content)
+	return ''.join(cleaner.clean(content)), cleaner.stats
+
+def media_renamer(duplicates : dict) -> tuple:
+	# references to the removed copies (in any attribute, written as they are in XML), and their entries in the manifest
+	media_names = {escape(duplicate, {'"': '&quot;'}): escape(original, {'"': '&quot;'}) for duplicate, original in duplicates.items()}
+	media_pattern = re.compile(r'="(\./)?(' + '|'.join(re.escape(name) for name in media_names) + ')"')
+	manifest_pattern = re.compile(r'<manifest:file-entry\s[^>]*?manifest:full-path="(?:\./)?(?:' + '|'.join(re.escape(name) for name in media_names) + r')"[^>]*?(?:/>|>.*?</manifest:file-entry>)\s*', re.DOTALL)
+	def rename_media(text : str) -> str:
+		return media_pattern.sub(lambda match: f'="{match[1] or ""}{media_names[match[2]]}"', text)
+	return rename_media, manifest_pattern
+
+def scan_document(doc : zipfile.ZipFile, rules=None, dedupe_media=False):
+	"""Find what can be cleaned in an open document, returning a scanned ContentCleaner (whose stats cover
+	the whole document) and the duplicate media found, for write_document."""
+	cleaner = ContentCleaner(rules)
+	with doc.open('content.xml') as member: cleaner.scan(member)
+	duplicates = find_duplicate_media(doc) if dedupe_media else {}
+	cleaner.stats.duplicate_media = len(duplicates)
+	cleaner.stats.duplicate_media_size = sum(doc.getinfo(name).compress_size for name in duplicates)
+	return cleaner, duplicates
 
-# parse arguments
-parser = ArgumentParser(
-	description="Used to clean up formatting information in OpenDocument files, because LibreOffice doesn't seem to do cleanup when saving on it's own. Focused on cleaning OpenDocument Text files, but also capable of cleaning other OpenDocument formats on a basic level. The cleaning process removes unused or redundant data in the content.xml (document/page content) by default. Your styles and such will not be modified.\nBy default, cleaned files are saved as copies so that you still have the original in case the script somehow messes something up. (It's a good idea to check the cleaned document to make sure it still looks correct, just in case.)",
-	epilog="""
+def write_document(doc : zipfile.ZipFile, new_doc : zipfile.ZipFile, cleaner, duplicates, compression_level=6):
+	"""Write the cleaned copy of a document scanned with scan_document to an empty zip file opened for writing."""
+	if duplicates: rename_media, manifest_pattern = media_renamer(duplicates)
+	# the mimetype has to come first
+	items = sorted(doc.infolist(), key=lambda item: item.filename != 'mimetype')
+	written = set()
+	for item in items:
+		if item.filename in written: continue
+		written.add(item.filename)
+		if item.filename == 'content.xml':
+			# write the cleaned styles, then clean the body on the way through
+			info = zipfile.ZipInfo('content.xml', localtime()[:6])
+			info.compress_type = zipfile.ZIP_DEFLATED
+			info._compresslevel = compression_level
+			info.external_attr = 0o600 << 16
+			with doc.open(item) as member, new_doc.open(info, 'w', force_zip64=item.file_size * 2 > zipfile.ZIP64_LIMIT) as new_member:
+				for text in cleaner.clean(member, rename_media if duplicates else None): new_member.write(text.encode())
+		# removed copies of media, and what refers to them elsewhere
+		elif item.filename in duplicates: pass
+		elif duplicates and item.filename in ('styles.xml', 'META-INF/manifest.xml'):
+			info = zipfile.ZipInfo(item.filename, item.date_time)
+			info.compress_type = zipfile.ZIP_DEFLATED
+			info._compresslevel = compression_level
+			info.external_attr = item.external_attr
+			text = doc.read(item).decode()
+			new_doc.writestr(info, (manifest_pattern.sub('', text) if item.filename == 'META-INF/manifest.xml' else rename_media(text)).encode())
+		# the mimetype also has to be stored uncompressed, without extra fields
+		elif item.filename == 'mimetype' and (item.compress_type != zipfile.ZIP_STORED or item.extra):
+			new_doc.writestr(zipfile.ZipInfo('mimetype', item.date_time), doc.read(item))
+		# everything else is copied without recompressing it
+		else: copy_member(doc, new_doc, item)
+
+def clean_document(document, rules=None, dedupe_media=False, compression_level=6):
+	"""Clean a document given as bytes or a seekable binary file object, returning the cleaned document as
+	bytes and the CleanupStats. If there's nothing to clean, the original bytes are returned."""
+	source = document if hasattr(document, 'read') else io.BytesIO(document)
+	with zipfile.ZipFile(source) as doc:
+		cleaner, duplicates = scan_document(doc, rules, dedupe_media)
+		if not cleaner.stats.changes:
+			source.seek(0)
+			return source.read(), cleaner.stats
+		output = io.BytesIO()
+		with zipfile.ZipFile(output, 'w') as new_doc: write_document(doc, new_doc, cleaner, duplicates, compression_level)
+	return output.getvalue(), cleaner.stats
+
+if __name__ == '__main__':
+	# parse arguments
+	parser = ArgumentParser(
+		description="Used to clean up formatting information in OpenDocument files, because LibreOffice doesn't seem to do cleanup when saving on it's own. Focused on cleaning OpenDocument Text files, but also capable of cleaning other OpenDocument formats on a basic level. The cleaning process removes unused or redundant data in the content.xml (document/page content) by default. Your styles and such will not be modified.\nBy default, cleaned files are saved as copies so that you still have the original in case the script somehow messes something up. (It's a good idea to check the cleaned document to make sure it still looks correct, just in case.)",
+		epilog="""
 values for disposal:
   none          leave untouched and create a copy with '-cleanup' at the end of the name
   trash         move to trash and replace with the cleaned files
   overwrite     overwrite originals (I strongly advise against using this, as this script is not perfect, and may make mistakes)
 
+When given a directory, only files with OpenDocument extensions (.odt, .ods, .odp, .odg, and so on) are cleaned.
+
 values for verbosity:
   0     nothing
   1     errors only
@@ -22,260 +498,218 @@ values for verbosity:
   3     same as 2 but adds data removal stats (default when cleaning multiple files or a directory)
   4     all available info (default when given a single file)
 
+rules file:
+  A JSON list of extra data to remove, like
+    [{"match": [" draw:z-index=\"", "\""], "message": "z-index entries"}]
+  Everything from the first string of "match" up to the end of the last is removed, with each string searched for after the one before it. "match" may also be a single string, which is removed wherever it appears.
+
 If an unhandled error occurs with the script, check on GitHub to see if it's been fixed recently, or if it hasn't, feel free to post the issue.
 """,
-	formatter_class=RawDescriptionHelpFormatter
-)
-parser.add_argument("paths", metavar='path', type=Path, nargs='+', help="path (or paths) to file or directory to clean. If given a directory, ")
-parser.add_argument("-d", "--disposal", type=str, choices=['none','trash','overwrite'], default='none', help="what to do with the original file after cleanup (default: none)")
-parser.add_argument("-r", "--recursive", action='store_true', help="also search for files in subdirectories when given a directory")
-parser.add_argument("-f", "--remove-fonts", action='store_true', help="remove font information (typeface only) from direct formatting (highly suggested if only one font is used in a given file)")
-parser.add_argument("-l", "--keep-language", dest="remove_language", action='store_false', help="keep language and country information - (this information is almost never relevant)")
-parser.add_argument("-v", "--verbosity", metavar="{0..4}", type=int, choices=range(5), help="how much information will be printed")
-args = parser.parse_args()
-
-# import send2trash
-if args.disposal == 'trash': from send2trash import send2trash
-# default verbosity
-if args.verbosity is None: args.verbosity = 3 if len(args.paths) > 1 or args.paths[0].is_dir() else 4
-
-# get files
-files = set()
-for path in args.paths:
-	if path.exists():
-		# test if file is a valid document
-		def is_document(path : Path) -> bool:
-			return path.is_file() and zipfile.is_zipfile(path) and zipfile.Path(path, 'content.xml').exists()
+		formatter_class=RawDescriptionHelpFormatter
+	)
+	parser.add_argument("paths", metavar='path', type=Path, nargs='+', help="path (or paths) to file or directory to clean. If given a directory, ")
+	parser.add_argument("-d", "--disposal", type=str, choices=['none','trash','overwrite'], default='none', help="what to do with the original file after cleanup (default: none)")
+	parser.add_argument("-r", "--recursive", action='store_true', help="also search for files in subdirectories when given a directory")
+	parser.add_argument("-f", "--remove-fonts", action='store_true', help="remove font information (typeface only) from direct formatting (highly suggested if only one font is used in a given file)")
+	parser.add_argument("-l", "--keep-language", dest="remove_language", action='store_false', help="keep language and country information - (this information is almost never relevant)")
+	parser.add_argument("--dedupe-media", action='store_true', help="keep only one copy of identical pictures and other media embedded in a document, and point everything that used the other copies at it")
+	parser.add_argument("-j", "--jobs", type=int, default=1, help="how many documents to clean at the same time, 0 uses one per CPU (default: 1)")
+	parser.add_argument("-m", "--manifest", type=Path, help="remember cleaned documents in this file, and skip documents that haven't changed since they were cleaned with the same settings")
+	parser.add_argument("-z", "--compression-level", metavar="{0..9}", type=int, choices=range(10), default=6, help="how hard to compress the cleaned content (other parts of the document are copied without recompressing them) (default: 6)")
+	parser.add_argument("--rules", type=Path, help="JSON file with additional data to remove (see below)")
+	parser.add_argument("-v", "--verbosity", metavar="{0..4}", type=int, choices=range(5), help="how much information will be printed")
+	args = parser.parse_args()
+	if args.jobs < 0: parser.error(f"argument -j/--jobs: invalid number of jobs: {args.jobs}")
+
+	# import send2trash
+	if args.disposal == 'trash': from send2trash import send2trash
+	# default verbosity
+	if args.verbosity is None: args.verbosity = 3 if len(args.paths) > 1 or args.paths[0].is_dir() else 4
+
+	# data removal rules
+	rules = make_rules(args.remove_fonts, args.remove_language)
+	if args.rules:
+		try: rules += read_rules(args.rules)
+		except (OSError, ValueError, KeyError, TypeError) as error: parser.error(f"can't read rules from '{args.rules}': {error}")
+
+	# get files
+	EXTENSIONS = {'.odt', '.ott', '.oth', '.odm', '.otm', '.ods', '.ots', '.odp', '.otp', '.odg', '.otg', '.odf', '.otf', '.odc', '.otc', '.odi', '.oti'}
+
+	def document_entry(path, stat) -> list:
+		# size, modification time and the checksum of content.xml (from the zip directory, so nothing is decompressed), or None if it isn't a document
+		try:
+			with zipfile.ZipFile(path) as doc: return [stat.st_size, stat.st_mtime_ns, doc.getinfo('content.xml').CRC]
+		except (zipfile.BadZipFile, KeyError, OSError): return None
+
+	def get_documents(dir_path : Path) -> dict:
+		dir_files = {}
+		sub_dir_files = {}
+		with os.scandir(dir_path) as entries:
+			for entry in entries:
+				if entry.is_file():
+					if os.path.splitext(entry.name)[1].lower() in EXTENSIONS and (document := document_entry(entry.path, entry.stat())):
+						dir_files[Path(entry.path)] = document
+						if args.verbosity >= 4: print(f"Found file {entry.path}")
+				elif args.recursive and entry.is_dir():
+					sub_dir_files.update(get_documents(Path(entry.path)))
+					if args.verbosity >= 4: print(f"Found directory {Path(entry.path).resolve()}")
+		if args.verbosity >= 3 and dir_files:
+			print(f"Found {len(dir_files)} files in {dir_path.resolve()}")
+		return dir_files | sub_dir_files
+
+	files = {}
+	for path in args.paths:
+		if path.exists():
+			# given directory
+			if path.is_dir():
+				if args.verbosity >= 3: print("Finding documents...")
+				files.update(get_documents(path))
+				
+				if args.verbosity:
+					if files:
+						if args.verbosity >= 2: print(f"Total of {len(files)} files found.")
+					elif args.recursive:
+						print(f"\33[93mNo documents found in '{path.resolve()}' or any subdirectories.\33[0m")
+					else:
+						print(f"\33[93mNo documents found in '{path.resolve()}'.\33[0m")
+						if args.verbosity >= 2: print("\33[93mUse '-r' or '--recursive' to also search subdirectories.\33[0m")
+			# given file
+			elif path.is_file() and (document := document_entry(path, path.stat())): files[path] = document
+			# not a document file
+			elif args.verbosity:
+				print(f"\33[93m'{path.name}' is not a document file\33[0m")
+				if args.verbosity >= 2: print("This script can only clean up OpenDocument Text files. (These typically end in .odt or .ott.)")
+		
+		elif args.verbosity: print(f"\33[93mNo such file or directory '{path}'\33[0m")
+
+	# skip documents that haven't changed since they were last cleaned with the same settings
+	settings = [args.remove_fonts, args.remove_language, [strings for strings, message in rules], args.dedupe_media]
+	manifest = None
+	if args.manifest:
+		try: manifest = json.loads(args.manifest.read_text())
+		except FileNotFoundError: manifest = {}
+		except (OSError, ValueError):
+			manifest = {}
+			if args.verbosity: print(f"\33[93mFailed to read manifest '{args.manifest}'\33[0m, cleaning all files.")
+		unchanged = 0
+		for path in list(files):
+			if manifest.get(os.path.abspath(path)) == files[path] + [settings]:
+				del files[path]
+				unchanged += 1
+				if args.verbosity >= 4: print(f"Skipping {path.name}, unchanged since it was last cleaned.")
+		if args.verbosity >= 2 and unchanged: print(f"Skipped {unchanged} unchanged files.")
+
+	# cleanup files
+	def clean_file(path : Path) -> tuple:
+		# returns whether the document was cleaned, how much smaller it got, and manifest entries for the files it leaves behind
+		cleaned = False
+		shrink = 0
+		entries = {}
+		# determine destination for saving
+		if args.disposal == 'none':
+			if path.suffix: save_path = path.with_name(path.name[:-len(path.suffix)] + '-cleaned' + path.name[-len(path.suffix):])
+			else: save_path = path.with_name(path.name + '-cleaned')
+		else: save_path = path
 		
-		# given directory
-		if path.is_dir():
-			if args.verbosity >= 3: print("Finding documents...")
+		# verify and read file
+		if args.verbosity >= 4: print(f"\nReading \33[95m{path.name}\33[0m.")
+		elif args.verbosity >= 3: print(f"\33[95m{path.name}\33[0m")
+		try:
+			# check that destination is available
+			if args.disposal == 'none' and save_path.exists(): raise Exception(f"'{save_path}' already exists")
+			# find what can be cleaned
+			with zipfile.ZipFile(path) as doc: cleaner, duplicates = scan_document(doc, rules, args.dedupe_media)
+		except KeyError: print(f"\33[93m'{path}' is not a document\33[0m, skipping file.")
+		except (Exception, FileNotFoundError, OSError) as error: print(f"\33[93m{error}\33[0m, skipping file.")
+		# clean document
+		else:
+			# cleanup
+			stats = cleaner.stats
+			if args.verbosity >= 4:
+				print("Beginning content cleanup process...\n\nRemoving irrelevant data...")
+				if args.remove_language: print("Searching for languages and countries...")
+				if args.remove_fonts: print("Searching for fonts...")
+			if args.verbosity >= 3:
+				for (strings, message), removed in zip(rules, stats.attributes):
+					if removed: print(f"\33[92mRemoved {removed} {message}.\33[0m")
 			
-			def get_documents(dir_path : Path) -> set:
-				dir_files = set()
-				sub_dir_files = set()
-				for path in dir_path.iterdir():
-					if is_document(path):
-						dir_files.add(path)
-						if args.verbosity >= 4: print(f"Found file {path}")
-					elif args.recursive and path.is_dir():
-						sub_dir_files.update(get_documents(path))
-						if args.verbosity >= 4: print(f"Found directory {path.resolve()}")
-				if args.verbosity >= 3 and dir_files:
-					print(f"Found {len(dir_files)} files in {dir_path.resolve()}")
-				return dir_files.union(sub_dir_files)
+			if args.verbosity >= 4: print("Searching for orphan styles...")
+			if args.verbosity >= 3 and stats.orphan_styles: print(f"\33[92mRemoved {stats.orphan_styles} orphan styles.\33[0m")
+			if args.verbosity >= 4: print("Searching for orphan list styles...")
+			if args.verbosity >= 3 and stats.orphan_list_styles: print(f"\33[92mRemoved {stats.orphan_list_styles} orphan lists styles.\33[0m")
 			
-			files.update(get_documents(path))
+			if args.verbosity >= 4: print("Searching for empty styles...")
+			if args.verbosity >= 3 and stats.empty_styles: print(f"\33[92mRemoved {stats.empty_styles} empty styles.\33[0m")
 			
-			if args.verbosity:
-				if files:
-					if args.verbosity >= 2: print(f"Total of {len(files)} files found.")
-				elif args.recursive:
-					print(f"\33[93mNo documents found in '{path.resolve()}' or any subdirectories.\33[0m")
-				else:
-					print(f"\33[93mNo documents found in '{path.resolve()}'.\33[0m")
-					if args.verbosity >= 2: print("\33[93mUse '-r' or '--recursive' to also search subdirectories.\33[0m")
-		# given file
-		elif is_document(path): files.add(path)
-		# not a document file
-		elif args.verbosity:
-			print(f"\33[93m'{path.name}' is not a document file\33[0m")
-			if args.verbosity >= 2: print("This script can only clean up OpenDocument Text files. (These typically end in .odt or .ott.)")
-	
-	elif args.verbosity: print_error(f"No such file or directory '{path}'")
-
-# cleanup files
-files_cleaned = 0
-total_shrink = 0
-for path in files:
-	# determine destination for saving
-	if args.disposal == 'none':
-		if path.suffix: save_path = path.with_name(path.name[:-len(path.suffix)] + '-cleaned' + path.name[-len(path.suffix):])
-		else: save_path = path + '-cleaned'
-	else: save_path = path
-	
-	# verify and read file
-	if args.verbosity >= 4: print(f"\nReading \33[95m{path.name}\33[0m.")
-	elif args.verbosity >= 3: print(f"\33[95m{path.name}\33[0m")
-	try:
-		# check that destination is available
-		if args.disposal == 'none' and save_path.exists(): raise Exception(f"'{save_path}' already exists")
-		# read content
-		content = zipfile.Path(path, 'content.xml').read_text()
-	except KeyError: print(f"\33[93m'{path}' is not a document\33[0m, skipping file.")
-	except (Exception, FileNotFoundError, OSError) as error: print(f"\33[93m{error}\33[0m, skipping file.")
-	# clean document
-	else:
-		# functions
-		def get_element_end(pos : int) -> int:
-			tag_end = content.find('>', pos) + 1
-			if content[tag_end - 2] == '/': return tag_end
-			levels = 1
-			while '<' in content[pos:]:
-				pos = content.find('<', pos + 1) + 1
-				tag_end = content.find('>', pos) + 1
-				if content[pos] == '/':
-					levels -= 1
-					if levels == 0: return tag_end
-				elif content[tag_end - 2] != '/': levels += 1
-		
-		def get_property(pos : int, name : str) -> str:
-			begin = content.find(name + '="', pos) + len(name) + 2
-			return content[begin : content.find('"', begin)]
-		
-		def remove_attribute(strings : list, message : str):
-			global content
-			removed = 0
-			while strings[0] in content:
-				search_pos = content.find(strings[0])
-				end_pos = search_pos + len(strings[0])
-				for string in strings[1:]: end_pos = content.index(string, end_pos) + len(string)
-				content = content[:search_pos] + content[end_pos:]
-				removed += 1
-			if args.verbosity >= 3 and removed: print(f"\33[92mRemoved {removed} {message}.\33[0m")
-		
-		# cleanup
-		if args.verbosity >= 4: print("Beginning content cleanup process...\n\nRemoving irrelevant data...")
-		remove_attribute([' officeooo:rsid="', '"'], "officeooo:rsid entries")
-		remove_attribute([' officeooo:paragraph-rsid="', '"'], "officeooo:paragraph-rsid entries")
-		remove_attribute([' loext:opacity="100%"'], "loext:opacity entries")
-		
-		if args.remove_language:
-			if args.verbosity >= 4: print("Searching for languages and countries...")
-			remove_attribute([' style:language', '"', '"'], "language entries")
-			remove_attribute([' style:country', '"', '"'], "country entries")
-		if args.remove_fonts:
-			if args.verbosity >= 4: print("Searching for fonts...")
-			remove_attribute(['<style:font-face', '/>'], "fonts")
-			remove_attribute([' style:font-name="', '"'], "styles")
-		
-		if args.verbosity >= 4: print("Searching for orphan styles...")
-		removed = 0
-		pos = 0
-		while '<style:style' in content[pos:]:
-			# find style
-			pos = content.find('<style:style', pos)
-			# check if style is used anywhere
-			if 'style-name="' + get_property(pos, 'style:name') in content: pos += 1
-			else:
-				# remove style
-				content = content[:pos] + content[get_element_end(pos):]
-				removed += 1 
-		if args.verbosity >= 3 and removed: print(f"\33[92mRemoved {removed} orphan styles.\33[0m")
-		
-		if args.verbosity >= 4: print("Searching for orphan list styles...")
-		removed = 0
-		pos = 0
-		while '<text:list-style' in content[pos:]:
-			# find style
-			pos = content.find('<text:list-style', pos)
-			# check if style is used anywhere
-			if 'style-name="' + get_property(pos, 'style:name') in content: pos += 1
-			else:
-				# remove style
-				content = content[:pos] + content[get_element_end(pos):]
-				removed += 1
-		if args.verbosity >= 3 and removed: print(f"\33[92mRemoved {removed} orphan lists styles.\33[0m")
-		
-		if args.verbosity >= 4: print("Searching for empty styles...")
-		removed = 0
-		while True:
-			# find style
-			match = re.search('<style:style style:name="(\w+)" style:family="[a-z]+" style:parent-style-name="(\w+)"(?:/|><style:text-properties/></style:style)>', content)
-			if not match: break
-			# remove style
-			content = content[:match.start()] + content[match.end():]
-			content = content.replace(f'style-name="{match[1]}"', f'style-name="{match[2]}"')
-			removed += 1
-		while True:
-			# find style
-			match = re.search('<style:style style:name="(\w+)" style:family="text"(?:/|><style:text-properties/></style:style)>', content)
-			if not match: break
-			# remove style
-			content = content[:match.start()] + content[match.end():]
-			while f'<text:span text:style-name="{match[1]}">' in content:
-				begin = content.find(f'<text:span text:style-name="{match[1]}">')
-				end = get_element_end(begin)
-				content = content[:begin] + content[content.find('>', begin) + 1 : end - 12] + content[end:]
-			removed += 1
-		if args.verbosity >= 3 and removed: print(f"\33[92mRemoved {removed} empty styles.\33[0m")
-		
-		if args.verbosity >= 4: print("Searching for identical styles...")
-		removed = 0
-		pos = 0
-		while '<style:style' in content[pos:]:
-			# find style
-			pos = content.find('<style:style', pos)
-			# get data in matchable format
-			data = content[content.find('"', pos + 25) : get_element_end(pos)]
-			# search for matching styles
-			compare_pos = get_element_end(pos)
-			while data in content[compare_pos:]:
-				compare_pos = content.rfind('<style:style', compare_pos, content.find(data, compare_pos))
-				# remove style
-				if content[content.find('"', compare_pos + 25) : get_element_end(compare_pos)] == data:
-					content = content.replace(f'style-name="{get_property(compare_pos, "style:name")}"', f'style-name="{get_property(pos, "style:name")}"')
-					content = content[:compare_pos] + content[get_element_end(compare_pos):]
-					removed += 1
-				# next style
-				compare_pos = get_element_end(compare_pos)
-			pos += 1
-		if args.verbosity >= 3 and removed: print(f"\33[92mMerged {removed} duplicate styles.\33[0m")
-		
-		if args.verbosity >= 4: print("Searching for identical list styles...")
-		removed = 0
-		pos = 0
-		while '<text:list-style' in content[pos:]:
-			# find style
-			pos = content.find('<text:list-style', pos)
-			# get data in matchable format
-			data = content[content.find('"', pos + 25) : get_element_end(pos)]
-			# search for matching styles
-			compare_pos = get_element_end(pos)
-			while data in content[compare_pos:]:
-				compare_pos = content.rfind('<text:list-style', compare_pos, content.find(data, compare_pos))
-				# remove style
-				if content[content.find('"', compare_pos + 30) : get_element_end(compare_pos)] == data:
-					content = content.replace(f'style-name="{get_property(compare_pos, "style:name")}"', f'style-name="{get_property(pos, "style:name")}"')
-					content = content[:compare_pos] + content[get_element_end(compare_pos):]
-					removed += 1
-				# next style
-				compare_pos = get_element_end(compare_pos)
-			pos += 1
-		if args.verbosity >= 3 and removed: print(f"\33[92mMerged {removed} identical list styles.\33[0m")
-		
-		# save file
-		if content != zipfile.Path(path, 'content.xml').read_text():
-			# create new file
-			temp_path = path.with_name(path.name + '.tmp')
-			if args.verbosity >= 4: print(f"\nSaving changes to {file_name}...")
-			try:
-				with zipfile.ZipFile(path) as doc:
-					with zipfile.ZipFile(temp_path, 'w') as temp_doc:
-						temp_doc.writestr('content.xml', content.encode(), compress_type=zipfile.ZIP_DEFLATED)
-						for item in doc.infolist():
-							if not item.filename in temp_doc.namelist():
-								temp_doc.writestr(item, doc.read(item.filename))
-				copystat(path, temp_path)
-				now = time()
-				utime(temp_path, (now, now))
-			# error creating file
-			except BaseException as error:
-				if args.verbosity: print(f"\33[91m{error}\33[0m, save aborted. (File has not been modified.)")
-			# rename file
-			else:
-				shrink = path.stat().st_size - temp_path.stat().st_size
+			if args.verbosity >= 4: print("Searching for identical styles...")
+			if args.verbosity >= 3 and stats.duplicate_styles: print(f"\33[92mMerged {stats.duplicate_styles} duplicate styles.\33[0m")
+			
+			if args.verbosity >= 4: print("Searching for identical list styles...")
+			if args.verbosity >= 3 and stats.duplicate_list_styles: print(f"\33[92mMerged {stats.duplicate_list_styles} identical list styles.\33[0m")
+			
+			if args.verbosity >= 3 and stats.duplicate_media: print(f"\33[92mRemoved {stats.duplicate_media} duplicate media files ({stats.duplicate_media_size}B).\33[0m")
+			
+			# save file
+			if stats.changes:
+				# create new file
+				temp_path = path.with_name(path.name + '.tmp')
+				if args.verbosity >= 4: print(f"\nSaving changes to {save_path.name}...")
 				try:
-					if args.disposal == 'trash': send2trash(path)
-				except OSError as error:
-					if args.verbosity: print(f"\33[91m{error}\33[0m, save aborted.")
+					with zipfile.ZipFile(path) as doc, zipfile.ZipFile(temp_path, 'w') as temp_doc: write_document(doc, temp_doc, cleaner, duplicates, args.compression_level)
+					copystat(path, temp_path)
+					now = time()
+					utime(temp_path, (now, now))
+				# error creating file
+				except BaseException as error:
+					if args.verbosity: print(f"\33[91m{error}\33[0m, save aborted. (File has not been modified.)")
+				# rename file
 				else:
-					temp_path.rename(save_path)
-					files_cleaned += 1
-					if args.verbosity >= 2: print(f"'{save_path}' saved ({shrink}B smaller).")
-					total_shrink += shrink
-		elif args.verbosity >= 2: print(f"No changes made to {path.name}.")
-
-if args.verbosity >= 2 and len(files) > 1:
-	if files_cleaned: print(f"{files_cleaned} out of {len(files)} files cleaned, {total_shrink}B total.")
-	else: print("No files were modified.")
+					shrink = path.stat().st_size - temp_path.stat().st_size
+					try:
+						if args.disposal == 'trash': send2trash(path)
+					except OSError as error:
+						if args.verbosity: print(f"\33[91m{error}\33[0m, save aborted.")
+					else:
+						temp_path.rename(save_path)
+						cleaned = True
+						if save_path != path: entries[os.path.abspath(path)] = files[path] + [settings]
+						if (document := document_entry(save_path, save_path.stat())): entries[os.path.abspath(save_path)] = document + [settings]
+						if args.verbosity >= 2: print(f"'{save_path}' saved ({shrink}B smaller).")
+			else:
+				entries[os.path.abspath(path)] = files[path] + [settings]
+				if args.verbosity >= 2: print(f"No changes made to {path.name}.")
+		return cleaned, shrink if cleaned else 0, entries
+
+	def run_quietly(path : Path) -> tuple:
+		# output from workers is printed in one piece
+		with redirect_stdout(io.StringIO()) as output: result = clean_file(path)
+		return output.getvalue(), result
+
+	files_cleaned = 0
+	total_shrink = 0
+	if args.jobs != 1 and len(files) > 1:
+		pool = ProcessPoolExecutor(args.jobs or None, get_context('fork'))
+		# results come back in the same order as the files, regardless of which worker finishes first
+		results = pool.map(run_quietly, files)
+	else:
+		pool = None
+		results = ((None, clean_file(path)) for path in files)
+	for output, (cleaned, shrink, entries) in results:
+		if output: print(output, end='', flush=True)
+		if cleaned:
+			files_cleaned += 1
+			total_shrink += shrink
+		if manifest is not None: manifest.update(entries)
+	if pool: pool.shutdown()
+
+	if args.verbosity >= 2 and len(files) > 1:
+		if files_cleaned: print(f"{files_cleaned} out of {len(files)} files cleaned, {total_shrink}B total.")
+		else: print("No files were modified.")
+
+	if args.manifest and manifest is not None:
+		temp_path = args.manifest.with_name(args.manifest.name + '.tmp')
+		try:
+			temp_path.write_text(json.dumps(manifest))
+			os.replace(temp_path, args.manifest)
+		except OSError as error:
+			if args.verbosity: print(f"\33[93mFailed to save manifest '{args.manifest}': {error}\33[0m")
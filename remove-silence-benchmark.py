@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""Benchmark remove-silence.py on synthetic wave files.
+
+Run this file as a script (see '--help')."""
+
+from argparse import ArgumentParser, RawDescriptionHelpFormatter
+from pathlib import Path
+from time import perf_counter
+from benchmark_harness import MIN_BYTES, MIN_SECONDS, compare_cases, compare_change, peak_rss, run_cases
+import importlib.util, json, os, platform, random, struct
+
+DENSITIES = {
+	# (fraction of silence, average pause length in seconds)
+	'none': (0, 0),
+	'sparse': (.1, 2),
+	'medium': (.3, 1),
+	'dense': (.5, .25),
+	'extreme': (.7, .05),
+}
+PHASES = ['decode', 'trim', 'middle', 'save', 'unsilence']
+
+def load_remove_silence(path : Path):
+	"""Import remove-silence.py as a module (its name has a dash in it, so it can't be imported normally)."""
+	spec = importlib.util.spec_from_file_location('remove_silence', path)
+	module = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(module)
+	return module
+
+def generate_wave(path : Path, channels : int, width : int, duration : float, density : str, rate : int):
+	"""Write a wave file with random sound broken up by digital silence, the same every time for the same settings."""
+	generator = random.Random(f"{channels}-{width}-{duration}-{density}-{rate}")
+	frame_size = channels * width
+	total = int(duration * rate)
+	# one second of noise is reused for all sound, which keeps generation fast for long files
+	noise = generator.randbytes(rate * frame_size)
+	# 8 bit samples are unsigned, so their silence is 128
+	silence = (b'\x80' if width == 1 else bytes(width)) * channels
+	silence_fraction, pause = DENSITIES[density]
+	with open(path, 'wb') as file:
+		file.write(struct.pack('<4sI4s4sIHHIIHH4sI', b'RIFF', 36 + total * frame_size, b'WAVE', b'fmt ', 16, 1, channels, rate, rate * frame_size, frame_size, width * 8, b'data', total * frame_size))
+		written = 0
+		while written < total:
+			if silence_fraction:
+				sound_length = max(1, int(generator.expovariate(1 / (pause * rate * (1 - silence_fraction) / silence_fraction))))
+				silence_length = max(1, int(generator.expovariate(1 / (pause * rate))))
+			else: sound_length, silence_length = total, 0
+			for length, silent in ((sound_length, False), (silence_length, True)):
+				length = min(length, total - written)
+				while length:
+					part = min(length, rate)
+					if silent: file.write(silence * part)
+					else:
+						offset = generator.randrange(rate - part + 1) * frame_size
+						file.write(noise[offset : offset + part * frame_size])
+					written += part
+					length -= part
+		if total * frame_size % 2: file.write(b'\0')
+
+def run_case(case : dict) -> dict:
+	"""Time each phase of removing silence from one file, through the same functions the script uses."""
+	remove_silence = load_remove_silence(Path(case['script']))
+	path = Path(case['path'])
+	temp_path = path.with_name(path.name + '.tmp')
+	def detector():
+		if case['detector'] == 'sample': return None
+		return remove_silence.EnergyDetector(case['tolerance'], case['window'], case['detector'])
+	results = {}
+
+	# scan and write in one pass, like the script does
+	start_time = perf_counter()
+	scanner = remove_silence.unsilence_file(path, temp_path, case['tolerance'], 1000, 'all', case['chunk'], detector=detector())
+	results['unsilence'] = perf_counter() - start_time
+
+	# write the kept ranges again, without scanning (like with a silence map)
+	start_time = perf_counter()
+	remove_silence.unsilence_file(path, temp_path, case['tolerance'], 1000, 'all', case['chunk'], scanner)
+	results['save'] = perf_counter() - start_time
+	temp_path.unlink(missing_ok=True)
+
+	# find the silence at the start and end, then between sounds (scan_data times decoding and detecting separately)
+	decode = []
+	for phase in ('trim', 'middle'):
+		seconds = {'decode': 0.0, 'detect': 0.0, 'copy': 0.0}
+		remove_silence.analyze_file(path, case['tolerance'], 1000, phase, case['chunk'], seconds, detector=detector())
+		results[phase] = seconds['detect']
+		decode.append(seconds['decode'])
+	results['decode'] = min(decode)
+
+	return {
+		'samples': scanner.length,
+		'removed': scanner.removed,
+		'seconds': results,
+		'peak_rss': peak_rss()
+	}
+
+def time_discovery(remove_silence, directory : Path, count : int) -> dict:
+	"""Time finding wave files in a directory where half of the files are wave files, the first time and
+	again with a manifest of all of them (like with --manifest when nothing changed)."""
+	directory.mkdir(parents=True, exist_ok=True)
+	existing = len(os.listdir(directory))
+	for index in range(existing, count):
+		with open(directory / f"{index:06}.{'wav' if index % 2 else 'txt'}", 'wb') as file:
+			if index % 2: file.write(struct.pack('<4sI4s', b'RIFF', 4, b'WAVE'))
+			else: file.write(b'not audio\n')
+	start_time = perf_counter()
+	found = remove_silence.find_wave_files(directory)
+	seconds = perf_counter() - start_time
+
+	settings = [0, 1000, 'all']
+	manifest = {os.path.abspath(path): remove_silence.manifest_record(os.stat(path), settings) for path in found}
+	start_time = perf_counter()
+	remove_silence.find_wave_files(directory, skip=lambda path, entry: remove_silence.in_manifest(manifest, path, settings, entry))
+	manifest_seconds = perf_counter() - start_time
+	return {'files': count, 'found': len(found), 'seconds': seconds, 'files_per_second': count / seconds if seconds else None, 'manifest_seconds': manifest_seconds}
+
+def format_rate(rate) -> str:
+	return f"{rate / 1e6:9.2f}M" if rate else "        -"
+
+if __name__ == '__main__':
+	# parse arguments
+	parser = ArgumentParser(
+		description="Benchmarks the phases of remove-silence.py on synthetic wave files. The files are generated deterministically, so results from different runs (or different versions of the script) can be compared directly.",
+		epilog="""
+values for density (fraction of each file that is silence between sounds):
+  none      no silence at all
+  sparse    about 10%, in long pauses
+  medium    about 30%
+  dense     about 50%, in short pauses
+  extreme   about 70%, in very short pauses
+
+values for detector:
+  sample    each sample is compared to the tolerance (the default in remove-silence.py)
+  rms       the RMS level of a window around each sample is compared (--window in remove-silence.py)
+  peak      the peak level of a window around each sample is compared
+
+phases:
+  decode     reading the file and making silence masks
+  trim       finding the silence at the start and end in the masks (--mode trim)
+  middle     finding the silence between sounds in the masks (--mode middle)
+  save       writing the file without silence that was already found (like --apply-map)
+  unsilence  finding and removing the silence in one pass, like the script does by default
+
+Each case runs in its own process so that the peak memory reported belongs to that case only.
+Generated files are kept in the work directory and reused by later runs.
+""",
+		formatter_class=RawDescriptionHelpFormatter
+	)
+	parser.add_argument("-c", "--channels", type=int, nargs='+', default=[1, 2], help="channel counts to test (default: 1 2)")
+	parser.add_argument("-w", "--widths", type=int, nargs='+', choices=[1, 2, 3, 4], default=[1, 2, 3, 4], help="sample widths in bytes to test (default: 1 2 3 4)")
+	parser.add_argument("-d", "--durations", type=float, nargs='+', default=[10, 60, 600], help="file durations in seconds to test (default: 10 60 600)")
+	parser.add_argument("-s", "--densities", nargs='+', choices=['none', 'sparse', 'medium', 'dense', 'extreme'], default=['none', 'sparse', 'dense', 'extreme'], help="silence densities to test (default: none sparse dense extreme)")
+	parser.add_argument("-D", "--detectors", nargs='+', choices=['sample', 'rms', 'peak'], default=['sample', 'rms'], help="silence detectors to test (default: sample rms)")
+	parser.add_argument("-t", "--tolerances", type=float, nargs='+', default=[0, .01], help="tolerances to test, like remove-silence.py's --tolerance (default: 0 0.01)")
+	parser.add_argument("--window", type=int, default=480, help="window size in samples for the rms and peak detectors (default: 480)")
+	parser.add_argument("-r", "--rate", type=int, default=48000, help="sample rate of the generated files (default: 48000)")
+	parser.add_argument("-n", "--discovery-files", type=int, default=2000, help="number of files in the directory used to time discovery (default: 2000)")
+	parser.add_argument("--repeat", type=int, default=5, help="how many times to run each case, keeping the fastest time of each phase (default: 5)")
+	parser.add_argument("--chunk", type=int, default=1048576, help="chunk size in samples, like remove-silence.py's --chunk (default: 1048576)")
+	parser.add_argument("--work-dir", type=Path, default=Path('remove-silence-benchmark'), help="where generated files are kept (default: ./remove-silence-benchmark)")
+	parser.add_argument("--script", type=Path, default=Path(__file__).with_name('remove-silence.py'), help="the remove-silence.py to benchmark (default: the one next to this script)")
+	parser.add_argument("-o", "--output", type=Path, help="save the results to this file as JSON")
+	parser.add_argument("--compare", type=Path, metavar='BASELINE', help="compare against results saved earlier with --output, and exit with status 1 if any phase got slower than the threshold")
+	parser.add_argument("--threshold", type=float, default=10, help=f"how many percent slower a phase may get before it counts as a regression, which it also has to by at least {MIN_SECONDS * 1000:g}ms (or {MIN_BYTES // 1048576}MB for peak memory), and be slower than every run of it in the baseline (default: 10)")
+	parser.add_argument("--case", help="run a single case given as JSON and print its results (used internally)")
+	args = parser.parse_args()
+
+	# run a single case (in a child process)
+	if args.case:
+		print(json.dumps(run_case(json.loads(args.case))))
+		exit()
+
+	args.work_dir.mkdir(parents=True, exist_ok=True)
+	remove_silence = load_remove_silence(args.script)
+	results = {
+		'python': platform.python_version(),
+		'numpy': remove_silence.numpy.__version__ if remove_silence.numpy else None,
+		'platform': platform.platform(),
+		'chunk': args.chunk,
+		'window': args.window,
+		'discovery': time_discovery(remove_silence, args.work_dir / 'discovery', args.discovery_files),
+		'cases': {}
+	}
+	print(f"Discovery: {results['discovery']['files']} files in {results['discovery']['seconds']:.3f}s ({results['discovery']['files_per_second']:.0f} files/s), {results['discovery']['manifest_seconds']:.3f}s with a manifest")
+	print(f"\n{'case':<40}" + ''.join(f"{phase + ' samples/s':>22}" for phase in PHASES) + f"{'peak RSS':>12}")
+
+	cases = {}
+	for duration in args.durations:
+		for channels in args.channels:
+			for width in args.widths:
+				for density in args.densities:
+					path = args.work_dir / f"{channels}ch-{width * 8}bit-{duration:g}s-{density}-{args.rate}.wav"
+					if not path.exists(): generate_wave(path, channels, width, duration, density, args.rate)
+					for detector in args.detectors:
+						for tolerance in args.tolerances:
+							name = f"{channels}ch-{width * 8}bit-{duration:g}s-{density}-{detector}-{tolerance:g}"
+							cases[name] = {'script': str(args.script.resolve()), 'path': str(path), 'chunk': args.chunk, 'detector': detector, 'tolerance': tolerance, 'window': args.window}
+
+	for name, result in run_cases(Path(__file__), cases, args.repeat, PHASES).items():
+		result['samples_per_second'] = {phase: result['samples'] / seconds if seconds else None for phase, seconds in result['seconds'].items()}
+		results['cases'][name] = result
+		print(f"{name:<40}" + ''.join(f"{format_rate(result['samples_per_second'][phase]):>22}" for phase in PHASES) + f"{result['peak_rss'] / 1048576:>10.1f}MB")
+
+	if args.output:
+		args.output.write_text(json.dumps(results, indent='\t'))
+		print(f"\nResults saved to {args.output}.")
+
+	# compare with baseline
+	if args.compare:
+		baseline = json.loads(args.compare.read_text())
+		print(f"\nCompared with {args.compare} (time relative to baseline):")
+		regressions = compare_change('discovery', results['discovery']['seconds'], baseline.get('discovery', {}).get('seconds'), args.threshold, MIN_SECONDS)
+		regressions += compare_change('discovery with a manifest', results['discovery']['manifest_seconds'], baseline.get('discovery', {}).get('manifest_seconds'), args.threshold, MIN_SECONDS)
+		regressions += compare_cases(results['cases'], baseline['cases'], PHASES, args.threshold)
+		if regressions:
+			print(f"\33[91m{regressions} regressions found.\33[0m")
+			exit(1)
+		print("No regressions found.")
@@ -1,360 +1,1511 @@
 #!/usr/bin/python
+"""Delete silence from wave files.
+
+Run this file as a script for the command line tool (see '--help'), or load it as a module to use it
+in-process. Since the file name has a dash in it, load it with importlib:
+
+	spec = importlib.util.spec_from_file_location('remove_silence', 'remove-silence.py')
+	remove_silence = importlib.util.module_from_spec(spec)
+	spec.loader.exec_module(remove_silence)
+
+find_silence and remove_silence work on buffers of PCM frames, while analyze_file and unsilence_file
+work on wave files by path. They all return a SilenceScanner, which holds the ranges kept, the
+silence found and how many samples were removed from where. find_wave_files finds the files to
+process in a directory, and in_manifest checks whether one was already processed."""
 
 from sys import argv
 from sys import exit
 import os
-from time import time
-from sndhdr import what
-import wave
-sys_arguments = argv
-sys_arguments.pop(0)
-
-# basic script info
-if not len(sys_arguments):
-	print("\033[95m──────── Silence Removal Script ────────\033[0m")
-	print("This script is used to delete silence from audio files, and can be used on wave (.wav) or MPEG-2 (.mp2) audio files.")
-	print("To view information on how to use this script, run it with '-h' or '--help' after the script name.")
-	exit()
-
-# help
-def show_help():
-	print("\n\033[95m──────── Animation Optimization Usage ────────\033[0m")
-	print("This script is used to delete silence from audio files. The script is compatible with wav type audio files.")
-	print("To remove the silence from a, run the script with the path to the anigif you want to optimize after the script name. You can also put a path to a directory to modify all of the audio files within it. By default, modified files will be saved as copies. That way, just in case the script does something that messes up the file, you still have the original. It's a good idea to make sure the audio still sounds right after using the script.")
-	print("\n\033[95m──────── Arguments ────────\033[0m")
-	print("-h, --help")
-	print("	Display this menu. This argument overrides all other operations, regardless of what other arguments are used.")
-	print("-d, --disposal <none|trash|overwrite>")
-	print("	What to do with the original file.")
-	print("	none ────── Leave untouched and create a copy with '-unsilenced' at the end of the name. (default)")
-	print("	trash ───── Move to trash and replace with the modified file.")
-	print("	overwrite ─ Overwrite originals. I strongly advise against using this. This script is not perfect, and may make mistakes!")
-	print("-l, --length <positive integer>")
-	print("	The minimum length (in samples) required for silence. This doesn't affect trimming the start or end. This is important to make sure that nodes in waves aren't removed. (default 1000)")
-	print("-m, --mode <all|middle|start|end|trim>")
-	print("	Where silence should be removed.")
-	print("	all ──── anywhere (default)")
-	print("	middle ─ between sound")
-	print("	start ── before sound begins")
-	print("	end ──── after sound ends")
-	print("	trim ─── before sound begins & after sound ends")
-	print("-r, --recursive")
-	print("	Also look in subdirectories when given a directory.")
-	print("-t, --tolerance <float 0-1>")
-	print("	The maximum value allowed to still be considered silence. (default 0)")
-	print("-v, --verbosity <integer 0-4>")
-	print("	How much information will be printed.")
-	print("	0 ─ nothing (not recommended)")
-	print("	1 ─ errors only")
-	print("	2 ─ + error tips & reading/saving")
-	print("	3 ─ + data removal stats (default when given directory)")
-	print("	4 ─ all available info (default when given document)")
-	exit()
-
-# get arguments
-arguments = []
-disposal = 'none'
-length_string = '1000'
-mode = 'all'
-recursive = False
-tolerance_string = '0'
-verbosity_string = ''
-
-while len(sys_arguments):
-	# argument
-	if sys_arguments[0][0] == '-':
-		if sys_arguments[0] == '-h' or sys_arguments[0] == '--help': show_help()
-		elif sys_arguments[0] == '-d' or sys_arguments[0] == '--disposal': disposal = sys_arguments.pop(1)
-		elif sys_arguments[0] == '-l' or sys_arguments[0] == '--length': min_length_string = sys_arguments.pop(1)
-		elif sys_arguments[0] == '-m' or sys_arguments[0] == '--mode': mode = sys_arguments.pop(1)
-		elif sys_arguments[0] == '-r' or sys_arguments[0] == '--recursive': recursive = True
-		elif sys_arguments[0] == '-t' or sys_arguments[0] == '--tolerance': tolerance_string = sys_arguments.pop(1)
-		elif sys_arguments[0] == '-v' or sys_arguments[0] == '--verbosity': verbosity_string = sys_arguments.pop(1)
-		else:
-			print(f"\033[93mERROR: '{sys_arguments[0]}' is not a recognized argument!\033[0m\nSee help (-h or --help) for information on arguments.")
-			exit()
-	# positional argument
-	else: arguments.append(sys_arguments[0])
-	# remove argument
-	sys_arguments.pop(0)
+from datetime import datetime, timezone
+from time import perf_counter, sleep
+from array import array
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from contextlib import redirect_stdout
+from io import StringIO
+from itertools import accumulate
+from multiprocessing import get_context
+from queue import Empty, Queue
+from threading import Thread
+import csv, ctypes, json, mmap, signal, struct, sys
+try: import numpy
+except ModuleNotFoundError: numpy = None
+
+MODES = ('all', 'middle', 'start', 'end', 'trim')
 
-del show_help
-del sys_arguments
+# wave files
 
-error = False
+# Sony Wave64 identifies chunks with GUIDs, which (other than the first) are a FourCC followed by the same 12 bytes
+W64_RIFF = b'riff\x2e\x91\xcf\x11\xa5\xd6\x28\xdb\x04\xc1\x00\x00'
+W64_SUFFIX = b'\xf3\xac\xd3\x11\x8c\xd1\x00\xc0\x4f\x8e\xdb\x8a'
 
-# get verbosity
-if verbosity_string:
+def is_wave_file(path):
+	"""Check the header of a file to see if it is a wave file (RIFF, RF64 or Wave64)."""
 	try:
-		verbosity = int(verbosity_string)
-		if verbosity < 0 or verbosity > 4: raise ValueError
-	except ValueError:
-		error = True
-		print(f"\033[93m[ERROR] '{verbosity_string}' is not a valid verbosity!\033[0m")
-		print("Verbosity must be an integer from 0 to 4.\nSee help (-h or --help) for more info on arguments.")
-		verbosity = 4
-elif len(arguments) and os.path.isdir(arguments[0]): verbosity = 3
-else: verbosity = 4
-del verbosity_string
-
-# get tolerance
-try:
-	tolerance = float(tolerance_string)
-	if tolerance < 0 or tolerance > 1: raise ValueError
-except ValueError:
-	error = True
-	if verbosity >= 1:
-		print(f"\033[93mERROR: '{tolerance_string}' is not a valid tolerance!\033[0m")
-		if verbosity >= 2: print("Tolerance must be a float from 0 to 1.\nSee help (-h or --help) for more info on arguments.")
-del tolerance_string
-
-# get min length
-try:
-	min_length = int(length_string)
-	if tolerance < 0: raise ValueError
-except ValueError:
-	error = True
-	if verbosity >= 1:
-		print(f"\033[93mERROR: '{length_string}' is not a valid minimum length!\033[0m")
-		if verbosity >= 2: print("Length must be a positive integer.\nSee help (-h or --help) for more info on arguments.")
-del length_string
-
-# check disposal method
-if not (disposal == 'none' or disposal == 'trash' or disposal == 'overwrite'):
-	error = True
-	if verbosity >= 1:
-		print(f"\033[93mERROR: '{disposal}' is not a valid disposal method!\033[0m")
-		if verbosity >= 2: print("Valid disposal methods are: none, trash, overwrite.\nSee help (-h or --help) for more info on arguments.")
-
-# check for send2trash
-elif disposal == 'trash':
-	try: from send2trash import send2trash
-	except ModuleNotFoundError:
-		error = True
-		if verbosity >= 1:
-			print("\033[93mERROR: No such module 'send2trash'.\033[0m")
-			if verbosity >= 2: print("The python module send2trash is required to use the trash disposal method. Either get send2trash, or use a different disposal method.")
-
-# check mode
-if not (mode == 'all' or mode == 'middle' or mode == 'start' or mode == 'end' or mode == 'trim'):
-	error = True
-	if verbosity >= 1:
-		print(f"\033[93mERROR: '{mode}' is not a valid mode!\033[0m")
-		if verbosity >= 2: print("Valid modes are: all, middle, start, end, trim.\nSee help (-h or --help) for more info on arguments.")
-
-# check path
-if not len(arguments):
-	error = True
-	if verbosity >= 1:
-		print("\033[93mERROR: No path given!\033[0m")
-		if verbosity >= 2: print("Please give a path to an audio file or directory.")
-
-# exit if there were errors
-if error: exit()
-del error
-
-
-# get audio files
-
-# given file
-if os.path.isfile(arguments[0]):
-	if what(arguments[0]).filetype == 'wav': files = [arguments[0]]
-	# if not a valid audio file file
+		with open(path, 'rb') as file: header = file.read(40)
+	except OSError: return False
+	return header[:4] in (b'RIFF', b'RF64') and header[8:12] == b'WAVE' or header[:16] == W64_RIFF and header[24:40] == b'wave' + W64_SUFFIX
+
+def read_wave_header(file):
+	"""Parse the headers of a wave file.
+	
+	Returns the fmt chunk, channel count, sample width, the offset and size of the data chunk, and the
+	container ('RIFF', 'RF64' or 'W64'), leaving the file positioned at the start of the data. Streams
+	that can't seek (like stdin) are read up to the data instead, and have no offset. Their size is None
+	if the header leaves it unknown."""
+	header = file.read(12)
+	format_chunk = None
+	if header[:4] in (b'RIFF', b'RF64') and header[8:] == b'WAVE':
+		container = header[:4].decode()
+		large_data_size = None
+		while True:
+			header = file.read(8)
+			if len(header) < 8: raise ValueError("no data chunk")
+			chunk_id, chunk_size = struct.unpack('<4sI', header)
+			if chunk_id == b'data': break
+			if chunk_id == b'fmt ': format_chunk = file.read(chunk_size + chunk_size % 2)[:chunk_size]
+			# RF64 keeps sizes too big for 32 bits here
+			elif chunk_id == b'ds64': large_data_size = struct.unpack_from('<Q', file.read(chunk_size + chunk_size % 2), 8)[0]
+			else: skip_bytes(file, chunk_size + chunk_size % 2)
+		if chunk_size == 0xFFFFFFFF and large_data_size is not None: chunk_size = large_data_size
+	elif header == W64_RIFF[:12]:
+		header += file.read(28)
+		if header[12:16] != W64_RIFF[12:] or header[24:] != b'wave' + W64_SUFFIX: raise ValueError("not a wave file")
+		container = 'W64'
+		while True:
+			header = file.read(24)
+			if len(header) < 24: raise ValueError("no data chunk")
+			chunk_id, chunk_size = struct.unpack('<16sQ', header)
+			# sizes include the header, and chunks are aligned to 8 bytes
+			chunk_size -= 24
+			if chunk_id == b'data' + W64_SUFFIX: break
+			if chunk_id == b'fmt ' + W64_SUFFIX: format_chunk = file.read(chunk_size + -chunk_size % 8)[:chunk_size]
+			else: skip_bytes(file, chunk_size + -chunk_size % 8)
+	else: raise ValueError("not a wave file")
+	if format_chunk is None: raise ValueError("no fmt chunk")
+	
+	format_tag, channels, _, _, _, bits = struct.unpack_from('<HHIIHH', format_chunk)
+	# WAVE_FORMAT_EXTENSIBLE keeps the real format at the start of the sub-format GUID
+	if format_tag == 0xFFFE: format_tag = struct.unpack_from('<H', format_chunk, 24)[0]
+	if format_tag != 1: raise ValueError("only PCM wave files are supported")
+	if not channels or not bits: raise ValueError("no channels or samples")
+	if not file.seekable():
+		# streamed files often leave the size as 0 or -1
+		return format_chunk, channels, (bits + 7) // 8, None, None if chunk_size in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF) else chunk_size, container
+	data_offset = file.tell()
+	# streamed or truncated files may claim more data than they contain
+	data_size = min(chunk_size, file.seek(0, os.SEEK_END) - data_offset)
+	file.seek(data_offset)
+	return format_chunk, channels, (bits + 7) // 8, data_offset, data_size, container
+
+def skip_bytes(file, count):
+	"""Move forward in a file, reading through streams that can't seek."""
+	if file.seekable(): file.seek(count, os.SEEK_CUR)
 	else:
-		if verbosity >= 1:
-			print(f"\033[93mERROR: '{os.path.basename(arguments[0])}' is not a valid audio file!\033[0m")
-			if verbosity >= 2: print("This script can only modify wave files. (.wav)")
-		exit()
+		while count and file.read(min(count, 1048576)): count -= min(count, 1048576)
 
-# given directory
-elif os.path.isdir(arguments[0]):
-	if verbosity >= 3: print("Finding audio files...")
-	files = []
+def wave_header(format_chunk, data_size, container='RIFF'):
+	"""Return the headers for a wave file with the given data size, up to the start of the data.
 	
-	def get_audio_files(directory):
-		global files
-		dir_audio_files = []
-		for sub_path in os.listdir(directory):
-			path = os.path.join(directory, sub_path)
-			if os.path.isfile(path) and what(path).filetype == 'wav':
-				if verbosity >= 4: print("Found audio_file", sub_path)
-				dir_audio_files.append(path)
-			elif recursive and os.path.isdir(path):
-				if verbosity >= 4: print("Found directory", os.path.abspath(path))
-				get_audio_files(path)
-		if verbosity >= 3 and recursive and len(dir_audio_files): print(f"Found {len(dir_audio_files)} audio files in {os.path.abspath(directory)}")
-		files += sorted(dir_audio_files)
+	The headers are the same length for any data size, so they can be written first and filled in once
+	the size is known. RF64 and Wave64 allow data over 4GB. A data size of None writes a RIFF header with
+	the sizes set to -1, the convention for streams where the size isn't known."""
+	if data_size is None: return struct.pack('<4sI4s4sI', b'RIFF', 0xFFFFFFFF, b'WAVE', b'fmt ', len(format_chunk) + len(format_chunk) % 2) + format_chunk + b'\0' * (len(format_chunk) % 2) + struct.pack('<4sI', b'data', 0xFFFFFFFF)
+	if container == 'W64':
+		format_chunk += bytes(-len(format_chunk) % 8)
+		riff_size = 16 + 8 + 16 + 24 + len(format_chunk) + 24 + data_size + -data_size % 8
+		return W64_RIFF + struct.pack('<Q', riff_size) + b'wave' + W64_SUFFIX + b'fmt ' + W64_SUFFIX + struct.pack('<Q', 24 + len(format_chunk)) + format_chunk + b'data' + W64_SUFFIX + struct.pack('<Q', 24 + data_size)
+	format_chunk += b'\0' * (len(format_chunk) % 2)
+	if container == 'RF64':
+		# the 32 bit sizes are all set to -1, and the real ones kept in the ds64 chunk
+		riff_size = 4 + 8 + 28 + 8 + len(format_chunk) + 8 + data_size + data_size % 2
+		block_align = struct.unpack_from('<H', format_chunk, 12)[0]
+		ds64 = struct.pack('<4sIQQQI', b'ds64', 28, riff_size, data_size, data_size // block_align, 0)
+		return struct.pack('<4sI4s', b'RF64', 0xFFFFFFFF, b'WAVE') + ds64 + struct.pack('<4sI', b'fmt ', len(format_chunk)) + format_chunk + struct.pack('<4sI', b'data', 0xFFFFFFFF)
+	riff_size = 4 + 8 + len(format_chunk) + 8 + data_size + data_size % 2
+	return struct.pack('<4sI4s4sI', b'RIFF', riff_size, b'WAVE', b'fmt ', len(format_chunk)) + format_chunk + struct.pack('<4sI', b'data', data_size)
+
+def wave_padding(data_size, container='RIFF'):
+	"""Return the padding that goes after data of the given size."""
+	return bytes(-data_size % 8 if container == 'W64' else data_size % 2)
+
+def copy_range(source, destination, offset, count):
+	"""Append count bytes from offset in source to destination, letting the kernel copy them where possible."""
+	while count:
+		try: copied = os.copy_file_range(source.fileno(), destination.fileno(), count, offset)
+		except (AttributeError, OSError):
+			try: copied = os.sendfile(destination.fileno(), source.fileno(), offset, count)
+			except (AttributeError, OSError):
+				source.seek(offset)
+				copied = destination.write(source.read(min(count, 16777216)))
+		if not copied: raise EOFError("source ended before the range was copied")
+		offset += copied
+		count -= copied
+
+# silence detection
+
+def silent_data(samples, sample_width):
+	"""Return the given number of silent samples (8 bit samples are unsigned, so their silence isn't zero)."""
+	return (b'\x80' if sample_width == 1 else bytes(sample_width)) * samples
+
+def silence_mask(audio_data, channels, sample_width, tolerance):
+	"""Return a mask with one byte per frame, 1 where every channel is within tolerance and 0 otherwise."""
+	# samples are compared as integers, so no float conversion is needed
+	limit = int(tolerance * 256 ** sample_width / 2)
+	if numpy is not None:
+		if sample_width == 3:
+			raw = numpy.frombuffer(audio_data, numpy.uint8).reshape(-1, 3).astype(numpy.int32)
+			samples = (raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16) << 8 >> 8
+		# 8 bit samples are unsigned, with silence at 128
+		elif sample_width == 1: samples = numpy.frombuffer(audio_data, numpy.uint8).astype(numpy.int64) - 128
+		else: samples = numpy.frombuffer(audio_data, {2: '<i2', 4: '<i4'}[sample_width]).astype(numpy.int64)
+		return (numpy.abs(samples) <= limit).reshape(-1, channels).all(axis=1).tobytes()
+	
+	# fallback without numpy
+	if sample_width == 3:
+		# widen to 32 bit samples (scaled by 256)
+		widened = bytearray(len(audio_data) // 3 * 4)
+		for byte in range(3): widened[byte + 1::4] = audio_data[byte::3]
+		audio_data = widened
+		limit *= 256
+	samples = array({1: 'B', 2: 'h', 3: 'i', 4: 'i'}[sample_width])
+	samples.frombytes(audio_data)
+	if sys.byteorder == 'big': samples.byteswap()
+	center = 128 if sample_width == 1 else 0
+	sample_mask = bytes(center - limit <= sample <= center + limit for sample in samples)
+	if channels == 1: return sample_mask
+	# combine channels with a bitwise and of the interleaved masks
+	frame_count = len(sample_mask) // channels
+	combined = int.from_bytes(sample_mask[::channels], 'little')
+	for channel in range(1, channels): combined &= int.from_bytes(sample_mask[channel::channels], 'little')
+	return combined.to_bytes(frame_count, 'little')
+
+class EnergyDetector:
+	"""Makes silence masks from the level of the window of frames around each frame, instead of from each sample.
 	
-	get_audio_files(arguments[0])
+	The level is the RMS or peak of each channel over the window, found with prefix sums (RMS) or block
+	maximums (peak), so the cost doesn't depend on the window size. Silence starts once the level falls
+	to tolerance and only ends once it rises above exit_tolerance, so noise hovering around a single
+	threshold doesn't chop pauses up. Frames before the start and after the end count as silent.
 	
-	if len(files):
-		if verbosity >= 2: print(f"Total of {len(files)} audio files found.")
-	else:
-		if verbosity >= 1:
-			if recursive: print(f"\033[93mNo audio files found in {os.path.abspath(arguments[0])} or any subdirectories.\033[0m")
+	Like SilenceScanner it is fed consecutive chunks and keeps what it needs between them. The mask
+	returned for a chunk lags behind it by half a window, and flush returns the rest at the end, so
+	use a new detector for every file."""
+	
+	def __init__(self, tolerance=0, window=1, measure='rms', exit_tolerance=None):
+		if measure != 'rms' and measure != 'peak': raise ValueError(f"'{measure}' is not a valid measure")
+		if window < 1: raise ValueError("the window must be at least one frame")
+		if exit_tolerance is None: exit_tolerance = tolerance
+		if exit_tolerance < tolerance: raise ValueError("the exit tolerance can't be below the tolerance")
+		self.tolerance = tolerance
+		self.exit_tolerance = exit_tolerance
+		self.window = window
+		self.measure = measure
+		self.silent = True
+		self.channels = 0
+		self.sample_width = 0
+		# levels of the frames still needed for the next windows
+		self.levels = None
+	
+	def __call__(self, audio_data, channels, sample_width):
+		"""Return the silence mask for as many frames as the data seen so far allows."""
+		if self.levels is None:
+			self.channels = channels
+			self.sample_width = sample_width
+			self.levels = self._levels(silent_data(self.window // 2 * channels, sample_width))
+		return self._mask(self._levels(audio_data))
+	
+	def flush(self):
+		"""Return the silence mask for the frames still held back at the end of the input."""
+		if self.levels is None: return b''
+		return self._mask(self._levels(silent_data((self.window - 1 - self.window // 2) * self.channels, self.sample_width)))
+	
+	def _levels(self, audio_data):
+		# squares per channel for RMS, or the loudest channel for peak
+		channels = self.channels
+		if numpy is not None:
+			if self.sample_width == 3:
+				raw = numpy.frombuffer(audio_data, numpy.uint8).reshape(-1, 3).astype(numpy.int32)
+				samples = (raw[:, 0] | raw[:, 1] << 8 | raw[:, 2] << 16) << 8 >> 8
+			elif self.sample_width == 1: samples = numpy.frombuffer(audio_data, numpy.uint8).astype(numpy.int16) - 128
+			else: samples = numpy.frombuffer(audio_data, {2: '<i2', 4: '<i4'}[self.sample_width])
+			samples = samples.astype(numpy.int64).reshape(-1, channels)
+			if self.measure == 'peak': return numpy.abs(samples).max(axis=1)
+			# a single frame this loud makes every window it is in loud, so clipping keeps the sums small (and exact
+			# when the limit is small) without changing the result
+			cap = 2 * self._limit(self.exit_tolerance) ** 2 * self.window + 1
+			return numpy.minimum(samples.astype(numpy.float64) ** 2, cap)
+		
+		# fallback without numpy
+		samples = array({1: 'B', 2: 'h', 3: 'i', 4: 'i'}[self.sample_width])
+		if self.sample_width == 3:
+			widened = bytearray(len(audio_data) // 3 * 4)
+			for byte in range(3): widened[byte + 1::4] = audio_data[byte::3]
+			samples.frombytes(widened)
+		else: samples.frombytes(audio_data)
+		if sys.byteorder == 'big': samples.byteswap()
+		if self.sample_width == 3: samples = [sample >> 8 for sample in samples]
+		elif self.sample_width == 1: samples = [sample - 128 for sample in samples]
+		if self.measure == 'peak': return [max(map(abs, samples[frame : frame + channels])) for frame in range(0, len(samples), channels)]
+		return [[sample * sample for sample in samples[channel::channels]] for channel in range(channels)]
+	
+	def _limit(self, tolerance):
+		return int(tolerance * 256 ** self.sample_width / 2)
+	
+	def _mask(self, levels):
+		window = self.window
+		enter_limit = self._limit(self.tolerance)
+		exit_limit = self._limit(self.exit_tolerance)
+		if self.measure == 'rms':
+			# compare window sums of squares instead of taking roots
+			enter_limit = enter_limit ** 2 * window
+			exit_limit = exit_limit ** 2 * window
+		
+		if numpy is not None:
+			levels = numpy.concatenate((self.levels, levels))
+			count = max(0, len(levels) - window + 1)
+			self.levels = levels[count:]
+			if not count: return b''
+			if self.measure == 'rms':
+				sums = numpy.concatenate((numpy.zeros((1, self.channels)), numpy.cumsum(levels, axis=0)))
+				window_levels = (sums[window:] - sums[:-window]).max(axis=1)
 			else:
-				print(f"\033[93mNo audio files found in {os.path.abspath(arguments[0])}.\033[0m")
-				if verbosity >= 2: print("Use -r or --recursive to also search subdirectories.")
-		exit()
+				# the maximum of a window is the maximum of the suffix of one block and the prefix of the next
+				blocks = numpy.concatenate((levels, numpy.zeros(-len(levels) % window, levels.dtype))).reshape(-1, window)
+				prefix = numpy.maximum.accumulate(blocks, axis=1).ravel()
+				suffix = numpy.maximum.accumulate(blocks[:, ::-1], axis=1)[:, ::-1].ravel()
+				window_levels = numpy.maximum(suffix[:count], prefix[window - 1 : window - 1 + count])
+			quiet = window_levels <= enter_limit
+			# in between the limits, stay in whatever state the last frame outside them set
+			settled = numpy.where(quiet | (window_levels > exit_limit), numpy.arange(count), -1)
+			numpy.maximum.accumulate(settled, out=settled)
+			silent = numpy.where(settled >= 0, quiet[settled], self.silent)
+			self.silent = bool(silent[-1])
+			return silent.tobytes()
+		
+		# fallback without numpy
+		if self.measure == 'rms':
+			levels = [carried + new for carried, new in zip(self.levels, levels)]
+			length = len(levels[0])
+		else:
+			levels = self.levels + levels
+			length = len(levels)
+		count = max(0, length - window + 1)
+		if self.measure == 'rms':
+			self.levels = [channel_levels[count:] for channel_levels in levels]
+			window_levels = [0] * count
+			for channel_levels in levels:
+				sums = [0, *accumulate(channel_levels)]
+				window_levels = [max(level, sums[frame + window] - sums[frame]) for frame, level in enumerate(window_levels)]
+		else:
+			self.levels = levels[count:]
+			window_levels = []
+			candidates = deque()
+			for frame, level in enumerate(levels):
+				while candidates and levels[candidates[-1]] <= level: candidates.pop()
+				candidates.append(frame)
+				if candidates[0] <= frame - window: candidates.popleft()
+				if frame >= window - 1: window_levels.append(levels[candidates[0]])
+		silent = bytearray(count)
+		state = self.silent
+		for frame, level in enumerate(window_levels):
+			if level <= enter_limit: state = True
+			elif level > exit_limit: state = False
+			silent[frame] = state
+		self.silent = state
+		return bytes(silent)
 
-# if given path is not a valid audio file or directory
-else:
-	if verbosity >= 1: print(f"\033[93mERROR: '{os.path.abspath(arguments[0])}' is not a valid audio file or directory!\033[0m")
-	exit()
-
-def print_progress(progress, size=20, show_percent=True, ndigits=1, end='\n'):
-	bars = int(min(progress, 1) * size)
-	remainder = progress * size - bars
-	print('[' + '#' * bars + '-' * (size - bars) + ']', end=' ' if show_percent else end)
-	if show_percent:
-		percent = round(progress * 100, ndigits)
-		print(' ' * ((ndigits + 4 if ndigits else 3) - len(str(percent))), percent, '%', sep='', end=end)
-
-# remove silence
-files_modified = 0
-total_shrink = 0
-for file_path in files:
+class SilenceScanner:
+	"""Finds the frame ranges to keep from a silence mask that is fed in consecutive chunks.
 	
-	file_name = os.path.basename(file_path)
-	if verbosity >= 4: print(f"\nReading \033[95m{file_name}\033[0m...")
-	elif verbosity >= 3: print(f"\033[95m{file_name}\033[0m")
+	Silence that is still open at the end of a chunk is carried over until sound is found or the
+	input ends, so the result is the same no matter how the mask is split up. Once finished, the
+	scanner also holds the results: the ranges kept, the silence removed, and how much of it was
+	removed from the start, middle and end."""
 	
-	channels = 0
-	rate = 0
-	frames = []
-	# get data
-	try:
-		if what(arguments[0]).filetype == 'wav':
-			with wave.open(file_path) as audio_file:
-				channels = audio_file.getnchannels()
-				rate = audio_file.getframerate()
-				sample_width = audio_file.getsampwidth()
-				starting_length = audio_file.getnframes()
-				if verbosity >= 3: print(f"File is {starting_length} samples long.")
-				# get audio
-				audio_data = audio_file.readframes(starting_length)
-				
-				def frame_value(frame):
-					return int.from_bytes(frame, 'little', signed=True) * 2 / 256 ** sample_width
-				
-				if verbosity >= 3: print("Reading file...")
-				last_print = 0
-				for frame in range(starting_length):
-					frame_data = audio_data[frame * channels * sample_width: (frame + 1) * channels * sample_width]
-					if channels == 1: frames.append(frame_value(frame_data))
-					elif channels == 2: frames.append([frame_value(frame_data[:sample_width]), frame_value(frame_data[sample_width:])])
-					if verbosity >= 3 and time() > last_print + .01:
-						print_progress(round(frame / starting_length, 3), end='\r')
-						last_print = time()
-				if verbosity >= 3: print_progress(1.0)
-	except:
-		if verbosity >= 1: print(f"\033[93mERROR: '{file_name}' failed to read. Skipping file.\033[0m")
+	def __init__(self, min_length=1000, mode='all'):
+		if mode not in MODES: raise ValueError(f"'{mode}' is not a valid mode")
+		self.min_length = min_length
+		self.mode = mode
+		self.trim_start = mode == 'all' or mode == 'trim' or mode == 'start'
+		self.trim_end = mode == 'all' or mode == 'trim' or mode == 'end'
+		self.middle = mode == 'all' or mode == 'middle'
+		self.length = 0
+		self.heard_sound = False
+		self.silence_start = None
+		self.removed_start = 0
+		self.removed_middle = 0
+		self.removed_end = 0
+		self.keep = []
+		self.silence = []
 	
-	# remove silence
+	def feed(self, silent_frames):
+		"""Scan the next chunk of the mask and return the (start, end) ranges that can be kept so far."""
+		intervals = []
+		def keep(start, end):
+			if intervals and intervals[-1][1] == start: intervals[-1] = (intervals[-1][0], end)
+			else: intervals.append((start, end))
+		
+		offset = self.length
+		pos = 0
+		while pos < len(silent_frames):
+			# sound
+			if self.silence_start is None:
+				silence = silent_frames.find(1, pos)
+				if silence == -1: silence = len(silent_frames)
+				if silence > pos:
+					keep(offset + pos, offset + silence)
+					self.heard_sound = True
+				if silence < len(silent_frames): self.silence_start = offset + silence
+				pos = silence
+			# silence
+			else:
+				sound = silent_frames.find(0, pos)
+				if sound == -1: break
+				silence_length = offset + sound - self.silence_start
+				if not self.heard_sound and self.trim_start: self.removed_start += silence_length
+				elif self.heard_sound and self.middle and silence_length >= self.min_length: self.removed_middle += silence_length
+				else:
+					keep(self.silence_start, offset + sound)
+					silence_length = 0
+				if silence_length: self.silence.append((self.silence_start, offset + sound))
+				self.silence_start = None
+				pos = sound
+		self.length += len(silent_frames)
+		self._record(intervals)
+		return intervals
+	
+	def finish(self):
+		"""Return the range to keep from any silence still open at the end of the input."""
+		if self.silence_start is None: return []
+		silence_length = self.length - self.silence_start
+		if self.trim_start and not self.heard_sound: self.removed_start += silence_length
+		elif self.trim_end: self.removed_end += silence_length
+		else:
+			self._record([(self.silence_start, self.length)])
+			return [(self.silence_start, self.length)]
+		if silence_length: self.silence.append((self.silence_start, self.length))
+		return []
+	
+	def _record(self, intervals):
+		for start, end in intervals:
+			if self.keep and self.keep[-1][1] == start: self.keep[-1] = (self.keep[-1][0], end)
+			else: self.keep.append((start, end))
+	
+	@property
+	def removed(self):
+		return self.removed_start + self.removed_middle + self.removed_end
+	
+	@property
+	def percent(self):
+		return round(self.removed / self.length * 100, 2) if self.length else 0.0
+
+def keep_intervals(silent_frames, min_length, mode):
+	"""Return the (start, end) frame ranges to keep, found in a single pass over the silence mask."""
+	scanner = SilenceScanner(min_length, mode)
+	return scanner.feed(silent_frames) + scanner.finish()
+
+def scan_data(audio_file, channels, sample_width, data_offset, length, scanner, keep, tolerance=0, chunk_size=1048576, seconds=None, progress=None, detector=None):
+	"""Scan the data chunk of an open wave file for silence in chunks, calling keep(start, end) with each range to keep.
+	
+	Silence is found by comparing each sample to the tolerance, unless a detector (like an EnergyDetector)
+	is given. Time spent decoding, detecting and keeping is added to the seconds dictionary if one is
+	given. The clock is only read at chunk boundaries, which is also when progress(fraction) is called."""
+	if seconds is None: seconds = {'decode': 0.0, 'detect': 0.0, 'copy': 0.0}
+	if detector is None: detector = lambda audio_data, channels, sample_width: silence_mask(audio_data, channels, sample_width, tolerance)
+	frame_size = channels * sample_width
+	with mmap.mmap(audio_file.fileno(), 0, access=mmap.ACCESS_READ) as audio_map:
+		if hasattr(mmap, 'MADV_SEQUENTIAL'): audio_map.madvise(mmap.MADV_SEQUENTIAL)
+		for chunk_start in range(0, length, chunk_size):
+			chunk_end = min(chunk_start + chunk_size, length)
+			decode_start = perf_counter()
+			with memoryview(audio_map)[data_offset + chunk_start * frame_size : data_offset + chunk_end * frame_size] as audio_data:
+				silent_frames = detector(audio_data, channels, sample_width)
+			detect_start = perf_counter()
+			intervals = scanner.feed(silent_frames)
+			copy_start = perf_counter()
+			for start, end in intervals: keep(start, end)
+			copy_end = perf_counter()
+			seconds['decode'] += detect_start - decode_start
+			seconds['detect'] += copy_start - detect_start
+			seconds['copy'] += copy_end - copy_start
+			if progress and chunk_end < length: progress(chunk_end / length)
+	# frames held back by the detector
+	if hasattr(detector, 'flush'):
+		detect_start = perf_counter()
+		intervals = scanner.feed(detector.flush())
+		seconds['detect'] += perf_counter() - detect_start
+		for start, end in intervals: keep(start, end)
+	copy_start = perf_counter()
+	for start, end in scanner.finish(): keep(start, end)
+	seconds['copy'] += perf_counter() - copy_start
+	if progress: progress(1.0)
+
+# library functions
+
+def find_silence(audio_data, channels, sample_width, tolerance=0, min_length=1000, mode='all', detector=None):
+	"""Find the silence in a buffer of PCM frames, returning a finished SilenceScanner."""
+	scanner = SilenceScanner(min_length, mode)
+	if detector is None: scanner.feed(silence_mask(audio_data, channels, sample_width, tolerance))
 	else:
-		def is_silent(frame):
-			if channels == 1: return abs(frame) <= tolerance
-			elif channels == 2:
-				return abs(frame[0]) <= tolerance and abs(frame[1]) <= tolerance
+		scanner.feed(detector(audio_data, channels, sample_width))
+		scanner.feed(detector.flush())
+	scanner.finish()
+	return scanner
+
+def remove_silence(audio_data, channels, sample_width, tolerance=0, min_length=1000, mode='all', detector=None):
+	"""Remove the silence from a buffer of PCM frames, returning the remaining frames and the SilenceScanner."""
+	scanner = find_silence(audio_data, channels, sample_width, tolerance, min_length, mode, detector)
+	frame_size = channels * sample_width
+	view = memoryview(audio_data)
+	return b''.join(view[start * frame_size : end * frame_size] for start, end in scanner.keep), scanner
+
+def analyze_file(path, tolerance=0, min_length=1000, mode='all', chunk_size=1048576, seconds=None, progress=None, detector=None):
+	"""Find the silence in a wave file without modifying it, returning a finished SilenceScanner."""
+	scanner = SilenceScanner(min_length, mode)
+	with open(path, 'rb') as audio_file:
+		format_chunk, channels, sample_width, data_offset, data_size, container = read_wave_header(audio_file)
+		length = data_size // (channels * sample_width)
+		scan_data(audio_file, channels, sample_width, data_offset, length, scanner, lambda start, end: None, tolerance, chunk_size, seconds, progress, detector)
+	return scanner
+
+def unsilence_file(path, output_path, tolerance=0, min_length=1000, mode='all', chunk_size=1048576, scanner=None, seconds=None, progress=None, detector=None):
+	"""Write a copy of a wave file with its silence removed, returning the SilenceScanner used.
+	
+	If a finished scanner is given (like one from analyze_file or a silence map), its silence is removed
+	without scanning the file again. Nothing is written until the first silence is found, so if there is
+	none (scanner.removed is 0) the output file isn't created at all. The output file is deleted if
+	anything goes wrong."""
+	rescan = scanner is None
+	if rescan: scanner = SilenceScanner(min_length, mode)
+	if seconds is None: seconds = {'decode': 0.0, 'detect': 0.0, 'copy': 0.0}
+	new_audio_file = None
+	try:
+		with open(path, 'rb') as audio_file:
+			format_chunk, channels, sample_width, data_offset, data_size, container = read_wave_header(audio_file)
+			frame_size = channels * sample_width
+			length = data_size // frame_size
+			
+			# frames kept from the start of the file, which are only copied once some silence is removed
+			kept = 0
+			new_data_size = 0
+			def start_output():
+				nonlocal new_audio_file, new_data_size
+				new_audio_file = open(output_path, 'wb', buffering=0)
+				new_audio_file.write(wave_header(format_chunk, 0, container))
+				if kept: copy_range(audio_file, new_audio_file, data_offset, kept * frame_size)
+				new_data_size = kept * frame_size
+			def write_range(start, end):
+				nonlocal kept, new_data_size
+				if new_audio_file is None:
+					if start == kept:
+						kept = end
+						return
+					start_output()
+				copy_range(audio_file, new_audio_file, data_offset + start * frame_size, (end - start) * frame_size)
+				new_data_size += (end - start) * frame_size
+			
+			if rescan: scan_data(audio_file, channels, sample_width, data_offset, length, scanner, write_range, tolerance, chunk_size, seconds, progress, detector)
+			else:
+				if scanner.length != length: raise ValueError("the scanner is for a file of a different length")
+				# copy everything between the known silence
+				copy_start = perf_counter()
+				start = 0
+				for silence_start, silence_end in list(scanner.silence) + [(length, length)]:
+					if silence_start > start: write_range(start, silence_start)
+					start = silence_end
+				seconds['copy'] += perf_counter() - copy_start
+			
+			if new_audio_file is None:
+				if not scanner.removed: return scanner
+				# only silence at the end was removed
+				copy_start = perf_counter()
+				start_output()
+				seconds['copy'] += perf_counter() - copy_start
+			
+			# fill in the sizes now that they are known
+			new_audio_file.write(wave_padding(new_data_size, container))
+			new_audio_file.seek(0)
+			new_audio_file.write(wave_header(format_chunk, new_data_size, container))
+			new_audio_file.close()
+	except BaseException:
+		if new_audio_file is not None:
+			new_audio_file.close()
+			os.remove(output_path)
+		raise
+	return scanner
+
+def unsilence_stream(input_stream, output_stream, tolerance=0, min_length=1000, mode='all', chunk_size=1048576, seconds=None, detector=None):
+	"""Read a wave file from a stream (like stdin) and write it to another with its silence removed, returning the SilenceScanner used.
+	
+	Only the silence that hasn't been decided on yet is held in memory. If the output can't seek back to
+	fill in the header at the end, the header is written with unknown sizes instead."""
+	if seconds is None: seconds = {'decode': 0.0, 'detect': 0.0, 'copy': 0.0}
+	if detector is None: detector = lambda audio_data, channels, sample_width: silence_mask(audio_data, channels, sample_width, tolerance)
+	scanner = SilenceScanner(min_length, mode)
+	format_chunk, channels, sample_width, data_offset, data_size, container = read_wave_header(input_stream)
+	frame_size = channels * sample_width
+	seekable = output_stream.seekable()
+	if seekable: header_offset = output_stream.tell()
+	else: container = 'RIFF'
+	output_stream.write(wave_header(format_chunk, 0 if seekable else None, container))
+	
+	# frames from buffer_start on may still need to be written
+	buffer = bytearray()
+	buffer_start = 0
+	new_data_size = 0
+	def keep(start, end):
+		nonlocal new_data_size
+		output_stream.write(buffer[(start - buffer_start) * frame_size : (end - buffer_start) * frame_size])
+		new_data_size += (end - start) * frame_size
+	
+	remaining = data_size
+	while remaining is None or remaining > 0:
+		decode_start = perf_counter()
+		audio_data = input_stream.read(chunk_size * frame_size if remaining is None else min(chunk_size * frame_size, remaining))
+		# drop a partial frame at the end
+		audio_data = audio_data[: len(audio_data) - len(audio_data) % frame_size]
+		if not audio_data: break
+		if remaining is not None: remaining -= len(audio_data)
+		buffer += audio_data
+		silent_frames = detector(audio_data, channels, sample_width)
+		detect_start = perf_counter()
+		intervals = scanner.feed(silent_frames)
+		copy_start = perf_counter()
+		for start, end in intervals: keep(start, end)
+		# everything before open silence has been written or dropped
+		decided = scanner.length if scanner.silence_start is None else scanner.silence_start
+		del buffer[: (decided - buffer_start) * frame_size]
+		buffer_start = decided
+		copy_end = perf_counter()
+		seconds['decode'] += detect_start - decode_start
+		seconds['detect'] += copy_start - detect_start
+		seconds['copy'] += copy_end - copy_start
+	
+	if hasattr(detector, 'flush'):
+		for start, end in scanner.feed(detector.flush()): keep(start, end)
+	copy_start = perf_counter()
+	for start, end in scanner.finish(): keep(start, end)
+	output_stream.write(wave_padding(new_data_size, container))
+	if seekable:
+		output_stream.seek(header_offset)
+		output_stream.write(wave_header(format_chunk, new_data_size, container))
+		output_stream.seek(0, os.SEEK_END)
+	output_stream.flush()
+	seconds['copy'] += perf_counter() - copy_start
+	return scanner
+
+# finding files
+
+def find_wave_files(directory, recursive=False, skip=None, found=None):
+	"""Return the paths of the wave files in a directory, and in its subdirectories if recursive.
+	
+	Each directory's files are sorted, and come after those of its subdirectories. skip(path, entry) is
+	called with every file and its scandir entry before its header is read, leaving out the files it
+	returns True for, and found(directory, paths) is called with the wave files of each directory."""
+	files = []
+	def search(directory):
+		paths = []
+		with os.scandir(directory) as entries:
+			for entry in entries:
+				if entry.is_file():
+					if skip and skip(entry.path, entry): continue
+					if is_wave_file(entry.path): paths.append(entry.path)
+				elif recursive and entry.is_dir(): search(entry.path)
+		paths.sort()
+		if found: found(directory, paths)
+		files.extend(paths)
+	search(directory)
+	return files
+
+def manifest_record(stat, settings):
+	"""Return what a manifest remembers about a processed file: its size and modification time, and the settings used."""
+	return [stat.st_size, stat.st_mtime_ns] + list(settings)
+
+def in_manifest(manifest, path, settings, entry=None):
+	"""Check whether a file is in a manifest unchanged and with the same settings, so it doesn't need processing
+	again. Only costs a lookup for files that aren't, and a stat (none if given its scandir entry) for those that are."""
+	recorded = manifest.get(os.path.abspath(path))
+	if recorded is None: return False
+	try: return recorded == manifest_record(entry.stat() if entry else os.stat(path), settings)
+	except OSError: return False
+
+# watching directories
+IN_CLOSE_WRITE, IN_MOVED_TO, IN_CREATE, IN_Q_OVERFLOW, IN_IGNORED, IN_ISDIR = 0x8, 0x80, 0x100, 0x4000, 0x8000, 0x40000000
+
+def list_files(directory, recursive=False):
+	"""Yield the paths of the files in a directory, and in its subdirectories if recursive."""
+	with os.scandir(directory) as entries:
+		for entry in entries:
+			if entry.is_file(): yield entry.path
+			elif recursive and entry.is_dir(follow_symlinks=False):
+				# subdirectories removed while they are listed are skipped
+				try: yield from list_files(entry.path, recursive)
+				except FileNotFoundError: pass
+
+def watch_directory(directory, recursive=False, interval=None):
+	"""Yield the paths of files in a directory as they finish being written, starting with the files already there.
+	
+	Uses inotify where available, so files are yielded as soon as they are closed after writing or moved
+	in. Otherwise (or if an interval is given) the directory is polled every interval seconds, and files
+	are yielded once their size and modification time stop changing. The same file may be yielded again
+	whenever it changes. Runs until the generator is closed, or raises OSError if the directory goes away."""
+	directory = os.path.abspath(directory)
+	inotify = -1
+	if interval is None:
+		try:
+			libc = ctypes.CDLL(None, use_errno=True)
+			inotify = libc.inotify_init1(os.O_CLOEXEC)
+		except (AttributeError, OSError, TypeError): pass
+	
+	# polling
+	if inotify < 0:
+		yielded = {}
+		previous = None
+		while True:
+			current = {}
+			for path in list_files(directory, recursive):
+				try: stat = os.stat(path)
+				except OSError: continue
+				current[path] = (stat.st_size, stat.st_mtime_ns)
+			for path, stat in current.items():
+				if yielded.get(path) != stat and (previous is None or previous.get(path) == stat):
+					yielded[path] = stat
+					yield path
+			yielded = {path: stat for path, stat in yielded.items() if path in current}
+			previous = current
+			sleep(interval or 1)
+	
+	# inotify
+	watches = {}
+	def scan(path):
+		# watch before listing, so nothing written in between is missed
+		watch = libc.inotify_add_watch(inotify, os.fsencode(path), IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE)
+		if watch >= 0: watches[watch] = path
+		with os.scandir(path) as entries:
+			for entry in entries:
+				if entry.is_file(): yield entry.path
+				elif recursive and entry.is_dir(follow_symlinks=False): yield from scan(entry.path)
+	try:
+		yield from scan(directory)
+		while True:
+			events = os.read(inotify, 65536)
+			offset = 0
+			while offset < len(events):
+				watch, mask, _, name_length = struct.unpack_from('iIII', events, offset)
+				name = os.fsdecode(events[offset + 16 : offset + 16 + name_length].rstrip(b'\0'))
+				offset += 16 + name_length
+				# events were dropped, so look at everything again
+				if mask & IN_Q_OVERFLOW: yield from scan(directory)
+				elif mask & IN_IGNORED:
+					# the directory itself was removed or unmounted, so there is nothing left to watch
+					if watches.pop(watch, None) == directory: raise FileNotFoundError(f"'{directory}' was removed")
+				elif watch in watches:
+					path = os.path.join(watches[watch], name)
+					if mask & IN_ISDIR:
+						if recursive and mask & (IN_CREATE | IN_MOVED_TO):
+							try: yield from scan(path)
+							except OSError: pass
+					elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO): yield path
+	finally: os.close(inotify)
+
+# silence maps
+MAP_FIELDS = ['path', 'size', 'mtime_ns', 'samples', 'removed', 'percent', 'removed_start', 'removed_middle', 'removed_end', 'tolerance', 'length', 'mode', 'silence']
+
+def map_record(path, scanner, tolerance):
+	"""Return the silence map record for a file scanned with the given scanner and tolerance."""
+	stat = os.stat(path)
+	return {
+		'path': os.path.abspath(path),
+		'size': stat.st_size,
+		'mtime_ns': stat.st_mtime_ns,
+		'samples': scanner.length,
+		'removed': scanner.removed,
+		'percent': scanner.percent,
+		'removed_start': scanner.removed_start,
+		'removed_middle': scanner.removed_middle,
+		'removed_end': scanner.removed_end,
+		'tolerance': tolerance,
+		'length': scanner.min_length,
+		'mode': scanner.mode,
+		'silence': [list(interval) for interval in scanner.silence]
+	}
+
+def record_scanner(record):
+	"""Return a finished SilenceScanner holding the silence listed in a silence map record."""
+	scanner = SilenceScanner(record['length'], record['mode'])
+	scanner.length = record['samples']
+	scanner.removed_start = record['removed_start']
+	scanner.removed_middle = record['removed_middle']
+	scanner.removed_end = record['removed_end']
+	scanner.silence = [tuple(interval) for interval in record['silence']]
+	return scanner
+
+def write_map_record(map_file, record):
+	"""Add a record to a silence map, written as CSV if the file name ends in '.csv' and as JSON lines otherwise."""
+	if map_file.name.endswith('.csv'):
+		row = dict(record, silence=' '.join(f"{start}-{end}" for start, end in record['silence']))
+		csv.DictWriter(map_file, MAP_FIELDS).writerow(row)
+	else: map_file.write(json.dumps(record) + '\n')
+
+def read_silence_map(path):
+	"""Read a silence map, returning its records by absolute path."""
+	records = {}
+	with open(path, newline='') as map_file:
+		if path.endswith('.csv'):
+			for row in csv.DictReader(map_file):
+				record = {field: row[field] if field in ('path', 'mode') else float(row[field]) if field in ('percent', 'tolerance') else int(row[field]) for field in MAP_FIELDS if field != 'silence'}
+				record['silence'] = [[int(frame) for frame in interval.split('-')] for interval in row['silence'].split()]
+				records[os.path.abspath(record['path'])] = record
+		else:
+			for line in map_file:
+				if line.strip():
+					record = json.loads(line)
+					records[os.path.abspath(record['path'])] = record
+	return records
+
+# command line
+if __name__ == '__main__':
+	sys_arguments = argv
+	sys_arguments.pop(0)
+
+	# basic script info
+	if not len(sys_arguments):
+		print("\033[95m──────── Silence Removal Script ────────\033[0m")
+		print("This script is used to delete silence from audio files, and can be used on wave (.wav) or MPEG-2 (.mp2) audio files.")
+		print("To view information on how to use this script, run it with '-h' or '--help' after the script name.")
+		exit()
+
+	# help
+	def show_help():
+		print("\n\033[95m──────── Animation Optimization Usage ────────\033[0m")
+		print("This script is used to delete silence from audio files. The script is compatible with wav type audio files.")
+		print("To remove the silence from a, run the script with the path to the anigif you want to optimize after the script name. You can also put a path to a directory to modify all of the audio files within it. By default, modified files will be saved as copies. That way, just in case the script does something that messes up the file, you still have the original. It's a good idea to make sure the audio still sounds right after using the script.")
+		print("Give '-' as the path to read a wave file from stdin and write it to stdout with the silence removed, for use in pipelines. Messages are printed to stderr instead.")
+		print("\n\033[95m──────── Arguments ────────\033[0m")
+		print("-h, --help")
+		print("	Display this menu. This argument overrides all other operations, regardless of what other arguments are used.")
+		print("-a, --analyze <file>")
+		print("	Only find where the silence is and save it to this file, without modifying anything. Saved as CSV if the name ends in '.csv', otherwise as JSON lines.")
+		print("-A, --apply-map <file>")
+		print("	Remove the silence listed in a file saved with --analyze, without scanning for it again. The files are taken from the map, so no path needs to be given.")
+		print("-c, --chunk <positive integer>")
+		print("	How many samples to scan at a time. Memory use depends on this, not on how long the file is. (default 1048576)")
+		print("-d, --disposal <none|trash|overwrite>")
+		print("	What to do with the original file.")
+		print("	none ────── Leave untouched and create a copy with '-unsilenced' at the end of the name. (default)")
+		print("	trash ───── Move to trash and replace with the modified file.")
+		print("	overwrite ─ Overwrite originals. I strongly advise against using this. This script is not perfect, and may make mistakes!")
+		print("-e, --energy <rms|peak>")
+		print("	How the level of a window is measured when using --window or --exit-tolerance. (default rms)")
+		print("	rms ── root mean square, good for recordings with a noise floor")
+		print("	peak ─ loudest sample")
+		print("-i, --interval <positive float>")
+		print("	With --watch, check the directory for new files this often (in seconds) instead of using inotify. Needed for network shares, where inotify doesn't see changes made by other machines. Polling is also used when inotify isn't available, every second by default.")
+		print("-j, --jobs <positive integer>")
+		print("	How many files to process at the same time when given a directory. 0 uses one job per CPU. (default 1)")
+		print("-l, --length <positive integer>")
+		print("	The minimum length (in samples) required for silence. This doesn't affect trimming the start or end. This is important to make sure that nodes in waves aren't removed. (default 1000)")
+		print("-M, --manifest <file>")
+		print("	Remember which files have been processed in this file, and skip them on later runs unless they or the settings have changed.")
+		print("-m, --mode <all|middle|start|end|trim>")
+		print("	Where silence should be removed.")
+		print("	all ──── anywhere (default)")
+		print("	middle ─ between sound")
+		print("	start ── before sound begins")
+		print("	end ──── after sound ends")
+		print("	trim ─── before sound begins & after sound ends")
+		print("-R, --report <file>")
+		print("	Save timings, throughput, sizes and samples removed for the run and each file to this file as JSON.")
+		print("-r, --recursive")
+		print("	Also look in subdirectories when given a directory.")
+		print("-t, --tolerance <float 0-1>")
+		print("	The maximum value allowed to still be considered silence. (default 0)")
+		print("-v, --verbosity <integer 0-4>")
+		print("	How much information will be printed.")
+		print("	0 ─ nothing (not recommended)")
+		print("	1 ─ errors only (default when reading from stdin)")
+		print("	2 ─ + error tips & reading/saving")
+		print("	3 ─ + data removal stats (default when given directory)")
+		print("	4 ─ all available info (default when given document)")
+		print("-W, --window <positive integer>")
+		print("	Judge each sample by the level (see --energy) of this many samples around it instead of by its own value, so noise and zero crossings don't break up silence. Takes the same time whatever the size. Around 10ms of samples (480 at 48kHz) works well for speech.")
+		print("-w, --watch")
+		print("	Keep running and remove silence from audio files in the given directory as soon as they finish being written. Files already in the directory are processed first. Use with --manifest to skip files that were already processed when restarting. Stop with Ctrl+C.")
+		print("-x, --exit-tolerance <float 0-1>")
+		print("	The value that must be passed to end silence once it has started. Setting this above --tolerance stops noise around the tolerance from cutting silence into pieces. (default same as --tolerance)")
+		exit()
+
+	# get arguments
+	arguments = []
+	analyze_path = ''
+	apply_map_path = ''
+	chunk_string = '1048576'
+	disposal = 'none'
+	energy = ''
+	exit_tolerance_string = ''
+	interval_string = ''
+	jobs_string = '1'
+	length_string = '1000'
+	manifest_path = ''
+	mode = 'all'
+	recursive = False
+	report_path = ''
+	tolerance_string = '0'
+	verbosity_string = ''
+	watch = False
+	window_string = ''
+
+	while len(sys_arguments):
+		# argument
+		if sys_arguments[0][0] == '-' and sys_arguments[0] != '-':
+			if sys_arguments[0] == '-h' or sys_arguments[0] == '--help': show_help()
+			elif sys_arguments[0] == '-a' or sys_arguments[0] == '--analyze': analyze_path = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-A' or sys_arguments[0] == '--apply-map': apply_map_path = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-c' or sys_arguments[0] == '--chunk': chunk_string = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-d' or sys_arguments[0] == '--disposal': disposal = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-e' or sys_arguments[0] == '--energy': energy = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-i' or sys_arguments[0] == '--interval': interval_string = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-j' or sys_arguments[0] == '--jobs': jobs_string = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-l' or sys_arguments[0] == '--length': length_string = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-M' or sys_arguments[0] == '--manifest': manifest_path = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-m' or sys_arguments[0] == '--mode': mode = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-R' or sys_arguments[0] == '--report': report_path = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-r' or sys_arguments[0] == '--recursive': recursive = True
+			elif sys_arguments[0] == '-t' or sys_arguments[0] == '--tolerance': tolerance_string = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-v' or sys_arguments[0] == '--verbosity': verbosity_string = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-W' or sys_arguments[0] == '--window': window_string = sys_arguments.pop(1)
+			elif sys_arguments[0] == '-w' or sys_arguments[0] == '--watch': watch = True
+			elif sys_arguments[0] == '-x' or sys_arguments[0] == '--exit-tolerance': exit_tolerance_string = sys_arguments.pop(1)
+			else:
+				print(f"\033[93mERROR: '{sys_arguments[0]}' is not a recognized argument!\033[0m\nSee help (-h or --help) for information on arguments.")
+				exit()
+		# positional argument
+		else: arguments.append(sys_arguments[0])
+		# remove argument
+		sys_arguments.pop(0)
+
+	del show_help
+	del sys_arguments
+
+	# when reading from stdin, the audio goes to stdout and messages go to stderr
+	pipe = len(arguments) > 0 and arguments[0] == '-'
+	if pipe:
+		audio_output = sys.stdout.buffer
+		sys.stdout = sys.stderr
+
+	error = False
+
+	# get verbosity
+	if verbosity_string:
+		try:
+			verbosity = int(verbosity_string)
+			if verbosity < 0 or verbosity > 4: raise ValueError
+		except ValueError:
+			error = True
+			print(f"\033[93m[ERROR] '{verbosity_string}' is not a valid verbosity!\033[0m")
+			print("Verbosity must be an integer from 0 to 4.\nSee help (-h or --help) for more info on arguments.")
+			verbosity = 4
+	elif apply_map_path or len(arguments) and os.path.isdir(arguments[0]): verbosity = 3
+	elif pipe: verbosity = 1
+	else: verbosity = 4
+	del verbosity_string
+
+	# get tolerance
+	try:
+		tolerance = float(tolerance_string)
+		if tolerance < 0 or tolerance > 1: raise ValueError
+	except ValueError:
+		error = True
+		tolerance = 0
+		if verbosity >= 1:
+			print(f"\033[93mERROR: '{tolerance_string}' is not a valid tolerance!\033[0m")
+			if verbosity >= 2: print("Tolerance must be a float from 0 to 1.\nSee help (-h or --help) for more info on arguments.")
+	del tolerance_string
+
+	# get energy detection settings
+	use_energy = bool(window_string or exit_tolerance_string or energy)
+	try:
+		window = int(window_string or '1')
+		if window < 1: raise ValueError
+	except ValueError:
+		error = True
+		if verbosity >= 1:
+			print(f"\033[93mERROR: '{window_string}' is not a valid window!\033[0m")
+			if verbosity >= 2: print("Window must be a positive integer.\nSee help (-h or --help) for more info on arguments.")
+	try:
+		exit_tolerance = float(exit_tolerance_string) if exit_tolerance_string else tolerance
+		if exit_tolerance < tolerance or exit_tolerance > 1: raise ValueError
+	except ValueError:
+		error = True
+		if verbosity >= 1:
+			print(f"\033[93mERROR: '{exit_tolerance_string}' is not a valid exit tolerance!\033[0m")
+			if verbosity >= 2: print("Exit tolerance must be a float from the tolerance to 1.\nSee help (-h or --help) for more info on arguments.")
+	if not energy: energy = 'rms'
+	elif not (energy == 'rms' or energy == 'peak'):
+		error = True
+		if verbosity >= 1:
+			print(f"\033[93mERROR: '{energy}' is not a valid energy measure!\033[0m")
+			if verbosity >= 2: print("Valid energy measures are: rms, peak.\nSee help (-h or --help) for more info on arguments.")
+	del window_string
+	del exit_tolerance_string
+
+	# get min length
+	try:
+		min_length = int(length_string)
+		if min_length < 0: raise ValueError
+	except ValueError:
+		error = True
+		if verbosity >= 1:
+			print(f"\033[93mERROR: '{length_string}' is not a valid minimum length!\033[0m")
+			if verbosity >= 2: print("Length must be a positive integer.\nSee help (-h or --help) for more info on arguments.")
+	del length_string
+
+	# get chunk size
+	try:
+		chunk_size = int(chunk_string)
+		if chunk_size < 1: raise ValueError
+	except ValueError:
+		error = True
+		if verbosity >= 1:
+			print(f"\033[93mERROR: '{chunk_string}' is not a valid chunk size!\033[0m")
+			if verbosity >= 2: print("Chunk size must be a positive integer.\nSee help (-h or --help) for more info on arguments.")
+	del chunk_string
+
+	# get jobs
+	try:
+		jobs = int(jobs_string)
+		if jobs < 0: raise ValueError
+	except ValueError:
+		error = True
+		if verbosity >= 1:
+			print(f"\033[93mERROR: '{jobs_string}' is not a valid number of jobs!\033[0m")
+			if verbosity >= 2: print("Jobs must be a positive integer.\nSee help (-h or --help) for more info on arguments.")
+	del jobs_string
+
+	# get polling interval
+	interval = None
+	if interval_string:
+		try:
+			interval = float(interval_string)
+			if interval <= 0: raise ValueError
+		except ValueError:
+			error = True
+			if verbosity >= 1:
+				print(f"\033[93mERROR: '{interval_string}' is not a valid interval!\033[0m")
+				if verbosity >= 2: print("Interval must be a positive number of seconds.\nSee help (-h or --help) for more info on arguments.")
+	del interval_string
+
+	# check disposal method
+	if not (disposal == 'none' or disposal == 'trash' or disposal == 'overwrite'):
+		error = True
+		if verbosity >= 1:
+			print(f"\033[93mERROR: '{disposal}' is not a valid disposal method!\033[0m")
+			if verbosity >= 2: print("Valid disposal methods are: none, trash, overwrite.\nSee help (-h or --help) for more info on arguments.")
+
+	# check for send2trash
+	elif disposal == 'trash':
+		try: from send2trash import send2trash
+		except ModuleNotFoundError:
+			error = True
+			if verbosity >= 1:
+				print("\033[93mERROR: No such module 'send2trash'.\033[0m")
+				if verbosity >= 2: print("The python module send2trash is required to use the trash disposal method. Either get send2trash, or use a different disposal method.")
+
+	# check mode
+	if mode not in MODES:
+		error = True
+		if verbosity >= 1:
+			print(f"\033[93mERROR: '{mode}' is not a valid mode!\033[0m")
+			if verbosity >= 2: print("Valid modes are: all, middle, start, end, trim.\nSee help (-h or --help) for more info on arguments.")
+
+	# check analysis options
+	if analyze_path and apply_map_path:
+		error = True
+		if verbosity >= 1: print("\033[93mERROR: --analyze and --apply-map can't be used together!\033[0m")
+
+	# check watch options
+	if watch:
+		if analyze_path or apply_map_path:
+			error = True
+			if verbosity >= 1: print("\033[93mERROR: --watch can't be used with --analyze or --apply-map!\033[0m")
+		elif len(arguments) and not os.path.isdir(arguments[0]):
+			error = True
+			if verbosity >= 1:
+				print(f"\033[93mERROR: '{os.path.abspath(arguments[0])}' is not a directory!\033[0m")
+				if verbosity >= 2: print("--watch needs a directory to watch.")
+
+	# check pipe options
+	if pipe and (analyze_path or apply_map_path or manifest_path or watch):
+		error = True
+		if verbosity >= 1: print("\033[93mERROR: --analyze, --apply-map, --manifest and --watch can't be used when reading from stdin!\033[0m")
+
+	# check path
+	if not len(arguments) and not apply_map_path:
+		error = True
+		if verbosity >= 1:
+			print("\033[93mERROR: No path given!\033[0m")
+			if verbosity >= 2: print("Please give a path to an audio file or directory.")
+
+	# exit if there were errors
+	if error: exit()
+	del error
+
+
+	# get audio files
+	run_started = datetime.now(timezone.utc).isoformat()
+	run_start = perf_counter()
+
+	# processed files are remembered, and skipped while they haven't changed and the settings are the same
+	settings = [tolerance, min_length, mode] + ([window, energy, exit_tolerance] if use_energy else [])
+	def manifest_entry(path):
+		return manifest_record(os.stat(path), settings)
+
+	manifest = None
+	unchanged = 0
+	if manifest_path and not analyze_path:
+		try:
+			with open(manifest_path) as manifest_file: manifest = json.load(manifest_file)
+		except FileNotFoundError: manifest = {}
+		except (OSError, ValueError):
+			manifest = {}
+			if verbosity >= 1: print(f"\033[93mERROR: Failed to read manifest '{manifest_path}'!\033[0m Processing all files.")
+	# when watching, processed files are always remembered so the script's own output isn't processed again
+	elif watch: manifest = {}
+
+	def is_unchanged(path, entry=None):
+		"""Check a file against the manifest before anything else is done with it, counting the unchanged ones."""
+		global unchanged
+		if not in_manifest(manifest, path, settings, entry): return False
+		unchanged += 1
+		if verbosity >= 4: print(f"Skipping {os.path.basename(path)}, unchanged since last run.")
+		return True
+
+	# given silence map
+	silence_map = None
+	if apply_map_path:
+		try: silence_map = read_silence_map(apply_map_path)
+		except (OSError, ValueError, KeyError):
+			if verbosity >= 1: print(f"\033[93mERROR: '{apply_map_path}' is not a valid silence map!\033[0m")
+			if verbosity >= 2: print("Silence maps are written with -a or --analyze.")
+			exit()
+		files = [path for path in silence_map if manifest is None or not is_unchanged(path)]
+		if verbosity >= 2: print(f"Total of {len(silence_map)} audio files in silence map.")
+
+	# watched directory (files are found as they are written)
+	elif watch:
+		files = []
+		if verbosity >= 2: print(f"Watching {os.path.abspath(arguments[0])} for audio files. Press Ctrl+C to stop.")
+
+	# stdin
+	elif pipe: files = ['-']
+
+	# given file
+	elif os.path.isfile(arguments[0]):
+		if manifest is not None and is_unchanged(arguments[0]): files = []
+		elif is_wave_file(arguments[0]): files = [arguments[0]]
+		# if not a valid audio file file
+		else:
+			if verbosity >= 1:
+				print(f"\033[93mERROR: '{os.path.basename(arguments[0])}' is not a valid audio file!\033[0m")
+				if verbosity >= 2: print("This script can only modify wave files. (.wav, including RF64 and Wave64)")
+			exit()
+
+	# given directory
+	elif os.path.isdir(arguments[0]):
+		if verbosity >= 3: print("Finding audio files...")
+		def found_files(directory, paths):
+			if verbosity >= 4:
+				if directory != arguments[0]: print("Found directory", os.path.abspath(directory))
+				for path in paths: print("Found audio_file", os.path.basename(path))
+			if verbosity >= 3 and recursive and len(paths): print(f"Found {len(paths)} audio files in {os.path.abspath(directory)}")
 		
-		def print_removed(message, start=starting_length):
-			removed = start - len(frames)
-			print(f"Removed {str(removed)}/{str(start)} ({str(round(removed / start * 100, 2))}%) {message}.")
+		files = find_wave_files(arguments[0], recursive, is_unchanged if manifest is not None else None, found_files)
 		
-		if mode == 'all' or mode == 'trim' or mode == 'start':
-			if verbosity >= 3: print("Trimming start...")
-			if is_silent(frames[0]):
-				pos = 1
-				while is_silent(frames[pos]): pos += 1
-				frames = frames[pos:]
-				if verbosity >= 3: print_removed("samples from start")
+		if len(files) or unchanged:
+			if verbosity >= 2: print(f"Total of {len(files) + unchanged} audio files found.")
+		else:
+			if verbosity >= 1:
+				if recursive: print(f"\033[93mNo audio files found in {os.path.abspath(arguments[0])} or any subdirectories.\033[0m")
+				else:
+					print(f"\033[93mNo audio files found in {os.path.abspath(arguments[0])}.\033[0m")
+					if verbosity >= 2: print("Use -r or --recursive to also search subdirectories.")
+			exit()
+
+	# if given path is not a valid audio file or directory
+	else:
+		if verbosity >= 1: print(f"\033[93mERROR: '{os.path.abspath(arguments[0])}' is not a valid audio file or directory!\033[0m")
+		exit()
+
+	if verbosity >= 2 and unchanged: print(f"Skipped {unchanged} unchanged files.")
+
+	def save_manifest():
+		try:
+			with open(manifest_path + '.tmp', 'w') as manifest_file: json.dump(manifest, manifest_file)
+			os.replace(manifest_path + '.tmp', manifest_path)
+		except OSError:
+			if verbosity >= 1: print(f"\033[93mERROR: Failed to save manifest '{manifest_path}'!\033[0m")
+
+	show_progress = True
+	def print_progress(progress, size=20, show_percent=True, ndigits=1, end='\n'):
+		if not show_progress: return
+		bars = int(min(progress, 1) * size)
+		bar = '[' + '#' * bars + '-' * (size - bars) + ']'
+		if show_percent: bar += f" {round(progress * 100, ndigits):>{ndigits + 4 if ndigits else 3}}%"
+		print(bar, end=end, flush=True)
+
+	def new_report(file_path):
+		"""Return an empty report entry for a file, filled in as it gets processed."""
+		return {
+			'path': os.path.abspath(file_path),
+			'status': 'failed',
+			'samples': 0,
+			'samples_removed': 0,
+			'bytes_in': 0,
+			'bytes_out': 0,
+			'seconds': {'decode': 0.0, 'detect': 0.0, 'copy': 0.0, 'save': 0.0, 'total': 0.0}
+		}
+
+	def finish_report(report, start_time):
+		report['seconds']['total'] = perf_counter() - start_time
+		report['samples_per_second'] = report['samples'] / report['seconds']['total'] if report['seconds']['total'] else None
+		return report
+
+	def print_removed(removed, total, message):
+		print(f"Removed {str(removed)}/{str(total)} ({str(round(removed / total * 100, 2))}%) {message}.")
+
+	def print_scan_stats(scanner, length):
+		if scanner.trim_start:
+			if scanner.removed_start: print_removed(scanner.removed_start, length, "samples from start")
 			elif verbosity >= 4: print("No silence found at start.")
-		
-		if mode == 'all' or mode == 'trim' or mode == 'end':
-			if verbosity >= 4: print("Trimming end...")
-			if is_silent(frames[-1]):
-				pos = -1
-				while is_silent(frames[pos - 1]): pos -= 1
-				frames = frames[:pos]
-				if verbosity >= 3: print_removed("samples from end", len(frames) - pos)
+		if scanner.trim_end:
+			if scanner.removed_end: print_removed(scanner.removed_end, length, "samples from end")
 			elif verbosity >= 4: print("No silence found at end.")
+		if scanner.middle:
+			trimmed_length = length - scanner.removed_start - scanner.removed_end
+			if scanner.removed_middle: print_removed(scanner.removed_middle, trimmed_length, "samples between sounds")
+			elif verbosity >= 4: print("No silence found between sounds.")
+
+	def read_length(file_path):
+		"""Return the length of a wave file in samples."""
+		with open(file_path, 'rb') as audio_file:
+			format_chunk, channels, sample_width, data_offset, data_size, container = read_wave_header(audio_file)
+		return data_size // (channels * sample_width)
+
+	def new_detector():
+		return EnergyDetector(tolerance, window, energy, exit_tolerance) if use_energy else None
+
+	def scan_progress(fraction):
+		print_progress(fraction, end='\r' if fraction < 1 else '\n')
+
+	def analyze_task(file_path):
+		"""Find the silence in one file without modifying it, returning its silence map record and its report entry."""
+		start_time = perf_counter()
+		report = new_report(file_path)
+		file_name = os.path.basename(file_path)
+		if verbosity >= 4: print(f"\nReading \033[95m{file_name}\033[0m...")
+		elif verbosity >= 3: print(f"\033[95m{file_name}\033[0m")
 		
-		if mode == 'all' or mode == 'middle':
-			if verbosity >= 4: print("Scanning for silence between sounds...")
-			search_pos = 1
-			trimmed_length = len(frames)
-			
-			last_print = 0
-			while search_pos < len(frames) - 1:
-				if is_silent(frames[search_pos]):
-					end_pos = search_pos + 1
-					while is_silent(frames[end_pos]): end_pos += 1
-					if end_pos - search_pos >= min_length: frames = frames[:search_pos] + frames[end_pos:]
-					else: search_pos = end_pos
-					if verbosity >= 3 and time() > last_print + .01:
-						print_progress(search_pos / len(frames), 20, True, end='\r')
-						last_print = time()
-				search_pos += 1
-			
+		try:
+			report['bytes_in'] = os.path.getsize(file_path)
+			length = report['samples'] = read_length(file_path)
+			if verbosity >= 3: print(f"File is {length} samples long.\nReading file...")
+			scanner = analyze_file(file_path, tolerance, min_length, mode, chunk_size, report['seconds'], scan_progress if verbosity >= 3 else None, new_detector())
+			record = map_record(file_path, scanner, tolerance)
+		except Exception:
+			if verbosity >= 1: print(f"\033[93mERROR: '{file_name}' failed to read. Skipping file.\033[0m")
+			return None, finish_report(report, start_time)
+		report['status'] = 'analyzed'
+		report['samples_removed'] = scanner.removed
+		
+		if verbosity >= 3:
+			print_scan_stats(scanner, length)
+			if scanner.removed: print(f"Found {scanner.removed}/{length} ({scanner.percent}%) samples of silence in total.")
+			else: print(f"No silence was found in {file_name}.")
+		return record, finish_report(report, start_time)
+
+	def output_path(file_path):
+		"""Return where the modified copy of a file is saved with the none disposal method."""
+		if '.' not in os.path.basename(file_path): return file_path + '-unsilenced'
+		dot_pos = file_path.rfind('.')
+		return file_path[:dot_pos] + '-unsilenced' + file_path[dot_pos:]
+
+	# remove silence
+	def process_task(file_path):
+		"""Remove silence from one file.
+		
+		Returns whether it was modified, how many bytes it shrank by, the paths that no longer need
+		processing with the current settings, and its report entry."""
+		start_time = perf_counter()
+		report = new_report(file_path)
+		file_name = os.path.basename(file_path)
+		if verbosity >= 4: print(f"\nReading \033[95m{file_name}\033[0m...")
+		elif verbosity >= 3: print(f"\033[95m{file_name}\033[0m")
+		
+		scanner = None
+		if silence_map is not None:
+			# use the silence found by an earlier analysis, as long as the file hasn't changed since
+			record = silence_map[os.path.abspath(file_path)]
+			try: stat = os.stat(file_path)
+			except OSError: stat = None
+			if not stat or stat.st_size != record['size'] or stat.st_mtime_ns != record['mtime_ns']:
+				if verbosity >= 1: print(f"\033[93mERROR: '{file_name}' has changed since it was analyzed. Skipping file.\033[0m")
+				report['status'] = 'stale'
+				return False, 0, [], finish_report(report, start_time)
+			scanner = record_scanner(record)
+		
+		temp_path = file_path + '.tmp'
+		try:
+			starting_length = report['samples'] = read_length(file_path)
 			if verbosity >= 3:
-				print_progress(1.0, 20, True)
-				if len(frames) < trimmed_length: print_removed("samples", trimmed_length)
-				elif verbosity >= 4: print("No silence found between sounds.")
+				print(f"File is {starting_length} samples long.")
+				if scanner is None: print("Reading file...")
+			scanner = unsilence_file(file_path, temp_path, tolerance, min_length, mode, chunk_size, scanner, report['seconds'], scan_progress if verbosity >= 3 else None, new_detector())
+		except Exception:
+			if verbosity >= 1: print(f"\033[93mERROR: '{file_name}' failed to process. Skipping file.\033[0m (File has not been modified.)")
 		
 		# save file
-		if len(frames) == starting_length:
-			if verbosity >= 3: print(f"No silence was found in {file_name}. Skipping saving process.")
-			elif verbosity >= 2: print(f"No silence was found in {file_name}.")
 		else:
-			if verbosity >= 3: print_removed("samples total")
-			if verbosity >= 4: print(f"\nSaving changes to {os.path.basename(file_name)}...")
-			initial_size = os.path.getsize(file_path)
+			trashed = False
 			try:
-				with wave.open(file_path + '.tmp', 'wb') as audio_file:
-					audio_file.setnchannels(channels)
-					audio_file.setframerate(rate)
-					audio_file.setsampwidth(sample_width)
-					
-					def frame_data(frame):
-						return [int(byte) for byte in int(round(frame / 2 * 256 ** sample_width)).to_bytes(sample_width, 'little', signed=True)]
-					
-					audio_data = []
-					last_print = 0
-					for frame in frames:
-						if channels == 1: audio_data += frame_data(frame)
-						elif channels == 2: audio_data += frame_data(frame[0]) + frame_data(frame[1])
-						if verbosity >= 3 and time() > last_print + .01:
-							print_progress(len(audio_data) / len(frames) / channels / sample_width, 20, True, end='\r')
-							last_print = time()
-					if verbosity >= 3: print_progress(1.0, 20, True)
-					audio_file.writeframes(bytes(audio_data))
-			except:
-				if verbosity >= 1:
-					print(f"\033[93m[ERROR] Failed to save {file_name}!\033[0m Saving aborted. (File has not been modified.)")
-			# rename file
-			else:
-				new_size = os.path.getsize(file_path + '.tmp')
-				new_file_path = file_path
-				error = False
-				if disposal == 'none':
-					if '.' in file_name:
-						dot_pos = file_path.rfind('.')
-						new_file_path = file_path[:dot_pos] + '-unsilenced' + file_path[dot_pos:]
-					else: new_file_path += '-unsilenced'
-					file_name = os.path.basename(new_file_path)
-				elif disposal == 'trash':
-					try: send2trash(file_path)
-					except OSError:
-						error = True
-						if verbosity >= 1: print("\033[93m[ERROR] Trashing failed!\033[0m Aborting save.")
+				save_start = perf_counter()
+				report['samples_removed'] = scanner.removed
+				report['bytes_in'] = os.path.getsize(file_path)
+				if verbosity >= 3: print_scan_stats(scanner, starting_length)
 				
-				if not error:
-					os.rename(file_path + '.tmp', new_file_path)
+				if not scanner.removed:
+					if verbosity >= 3: print(f"No silence was found in {file_name}. Skipping saving process.")
+					elif verbosity >= 2: print(f"No silence was found in {file_name}.")
+					report['status'] = 'unchanged'
+					report['bytes_out'] = report['bytes_in']
+					report['seconds']['save'] = perf_counter() - save_start
+					return False, 0, [file_path], finish_report(report, start_time)
+				else:
+					if verbosity >= 3: print_removed(scanner.removed, starting_length, "samples total")
+					if verbosity >= 4: print(f"\nSaving changes to {os.path.basename(file_name)}...")
+					initial_size = os.path.getsize(file_path)
+					new_size = os.path.getsize(temp_path)
+					new_file_path = file_path
+					error = False
+					if disposal == 'none':
+						new_file_path = output_path(file_path)
+						file_name = os.path.basename(new_file_path)
+					elif disposal == 'trash':
+						try:
+							send2trash(file_path)
+							trashed = True
+						except OSError:
+							error = True
+							os.remove(temp_path)
+							if verbosity >= 1: print("\033[93m[ERROR] Trashing failed!\033[0m Aborting save.")
 					
-					if verbosity >= 2: print(f"{file_name} saved ({initial_size - new_size}B smaller).")
-					files_modified += 1
-					total_shrink += initial_size - new_size
+					if not error:
+						os.rename(temp_path, new_file_path)
+						
+						if verbosity >= 2: print(f"{file_name} saved ({initial_size - new_size}B smaller).")
+						report['status'] = 'modified'
+						report['bytes_out'] = new_size
+						report['seconds']['save'] = perf_counter() - save_start
+						return True, initial_size - new_size, [file_path, new_file_path] if disposal == 'none' else [new_file_path], finish_report(report, start_time)
+			# the file was moved or deleted while it was being processed, or couldn't be replaced
+			except OSError:
+				report['status'] = 'failed'
+				if trashed:
+					if verbosity >= 1: print(f"\033[93mERROR: '{file_name}' was moved to the trash, but saving failed!\033[0m The processed copy is kept at '{temp_path}'.")
+				else:
+					if verbosity >= 1: print(f"\033[93mERROR: '{file_name}' failed to save. Skipping file.\033[0m (File has not been modified.)")
+					try: os.remove(temp_path)
+					except OSError: pass
+		return False, 0, [], finish_report(report, start_time)
+
+	def pipe_task(file_path):
+		"""Remove silence from a wave file read from stdin, writing the result to stdout."""
+		start_time = perf_counter()
+		report = new_report(file_path)
+		report['path'] = file_path
+		try: scanner = unsilence_stream(sys.stdin.buffer, audio_output, tolerance, min_length, mode, chunk_size, report['seconds'], new_detector())
+		except Exception:
+			if verbosity >= 1: print("\033[93mERROR: Failed to process the audio from stdin!\033[0m")
+			return False, 0, [], finish_report(report, start_time)
+		report['status'] = 'modified' if scanner.removed else 'unchanged'
+		report['samples'] = scanner.length
+		report['samples_removed'] = scanner.removed
+		if verbosity >= 3:
+			print(f"Read {scanner.length} samples from stdin.")
+			print_scan_stats(scanner, scanner.length)
+			if scanner.removed: print_removed(scanner.removed, scanner.length, "samples total")
+			else: print("No silence was found.")
+		return bool(scanner.removed), 0, [], finish_report(report, start_time)
+
+	discovery_seconds = perf_counter() - run_start
+	task = analyze_task if analyze_path else pipe_task if pipe else process_task
+
+	def run_quietly(file_path):
+		"""Run the task in a worker process, capturing its output so it can be printed in one piece."""
+		global show_progress
+		show_progress = False
+		with redirect_stdout(StringIO()) as output: result = task(file_path)
+		return output.getvalue(), result
+
+	def watch_results():
+		"""Process audio files in the watched directory as they finish being written, yielding results as they come in."""
+		# the queue is bounded, so the watcher stops reading events while the workers are busy
+		found = Queue(256)
+		def find_files():
+			# the watcher is restarted if it fails (like when a subdirectory is removed while it is listed), and an error is passed on once the directory itself is gone
+			while True:
+				try:
+					for path in watch_directory(arguments[0], recursive, interval): found.put(os.path.abspath(path))
+				except Exception as error:
+					if not os.path.isdir(arguments[0]):
+						found.put(error)
+						return
+					if verbosity >= 1: print(f"\033[93mERROR: Watching failed ({error})!\033[0m Restarting.")
+					sleep(interval or 1)
+		Thread(target=find_files, daemon=True).start()
+		
+		def failed_result(path, error):
+			# one file failing doesn't stop the watch
+			if verbosity >= 1: print(f"\033[93mERROR: '{os.path.basename(path)}' failed to process ({error}). Skipping file.\033[0m")
+			report = finish_report(new_report(path), perf_counter())
+			return None, ((None, report) if analyze_path else (False, 0, [], report))
+		def result_of(future, path):
+			try: return future.result()
+			except Exception as error: return failed_result(path, error)
+		
+		running = {}
+		# files written again while being processed are looked at once they are done
+		waiting = set()
+		retry = deque()
+		try:
+			while True:
+				for future in [future for future in running if future.done()]:
+					path = running.pop(future)
+					yield result_of(future, path)
+					if path in waiting:
+						waiting.remove(path)
+						retry.append(path)
+				
+				if retry: path = retry.popleft()
+				else:
+					try: path = found.get(timeout=.05 if running else None)
+					except Empty: continue
+					if isinstance(path, Exception):
+						global watch_failed
+						watch_failed = True
+						if verbosity >= 1: print(f"\033[93mERROR: Stopped watching, '{os.path.abspath(arguments[0])}' is no longer available ({path}).\033[0m")
+						for future, path in running.items(): yield result_of(future, path)
+						return
+				if path in running.values() or disposal == 'none' and path in map(output_path, running.values()):
+					waiting.add(path)
+					continue
+				if path.endswith('.tmp') or not is_wave_file(path): continue
+				try:
+					if manifest.get(path) == manifest_entry(path): continue
+				except OSError: continue
+				
+				if not pool:
+					# like the workers, the file being processed is finished before Ctrl+C stops the watch
+					interrupted = []
+					def interrupt(signum, frame):
+						if not interrupted and verbosity >= 2: print(f"\nStopping once '{os.path.basename(path)}' is done...")
+						interrupted.append(signum)
+					handler = signal.signal(signal.SIGINT, interrupt)
+					try: result = task(path)
+					except Exception as error: result = failed_result(path, error)[1]
+					finally: signal.signal(signal.SIGINT, handler)
+					yield None, result
+					if interrupted: raise KeyboardInterrupt
+				elif len(running) >= (jobs or os.cpu_count()):
+					wait(running, return_when=FIRST_COMPLETED)
+					retry.appendleft(path)
+				else: running[pool.submit(run_quietly, path)] = path
+		except KeyboardInterrupt:
+			if verbosity >= 2: print("\nStopped watching.")
+			for future, path in running.items(): yield result_of(future, path)
+
+	if analyze_path:
+		try:
+			map_file = open(analyze_path, 'w', newline='')
+			if analyze_path.endswith('.csv'): csv.DictWriter(map_file, MAP_FIELDS).writeheader()
+		except OSError:
+			if verbosity >= 1: print(f"\033[93mERROR: Failed to create silence map '{analyze_path}'!\033[0m")
+			exit()
+
+	files_modified = 0
+	total_shrink = 0
+	files_analyzed = 0
+	total_samples = 0
+	total_silence = 0
+	# workers ignore Ctrl+C when watching, so files being processed are finished before stopping
+	if watch and jobs != 1: pool = ProcessPoolExecutor(jobs or None, get_context('fork'), initializer=signal.signal, initargs=(signal.SIGINT, signal.SIG_IGN))
+	elif jobs != 1 and len(files) > 1: pool = ProcessPoolExecutor(jobs or None, get_context('fork'))
+	else: pool = None
+	watch_failed = False
+	if watch: results = watch_results()
+	# results come back in the same order as the files, regardless of which worker finishes first
+	elif pool: results = pool.map(run_quietly, files)
+	else: results = ((None, task(file_path)) for file_path in files)
+	# reports are only kept when they are saved (or needed for the exit status), so a long watch doesn't pile them up
+	reports = []
+	files_processed = 0
+	for output, result in results:
+		if output: print(output, end='', flush=True)
+		files_processed += 1
+		if report_path or pipe: reports.append(result[-1])
+		if analyze_path:
+			record = result[0]
+			if record:
+				write_map_record(map_file, record)
+				files_analyzed += 1
+				total_samples += record['samples']
+				total_silence += record['removed']
+			continue
+		modified, shrink, done_paths, _ = result
+		if modified:
+			files_modified += 1
+			total_shrink += shrink
+		if manifest is not None:
+			for path in done_paths:
+				try: manifest[os.path.abspath(path)] = manifest_entry(path)
+				except OSError: pass
+			if watch and manifest_path: save_manifest()
+	if pool: pool.shutdown()
+
+	if report_path:
+		totals = {'files': len(reports)}
+		for field in ('samples', 'samples_removed', 'bytes_in', 'bytes_out'): totals[field] = sum(report[field] for report in reports)
+		for status in ('modified', 'unchanged', 'analyzed', 'stale', 'failed'): totals[status] = sum(report['status'] == status for report in reports)
+		totals['seconds'] = {phase: sum(report['seconds'][phase] for report in reports) for phase in ('decode', 'detect', 'copy', 'save', 'total')}
+		run_seconds = perf_counter() - run_start
+		try:
+			with open(report_path, 'w') as report_file:
+				json.dump({
+					'started': run_started,
+					'settings': {'tolerance': tolerance, 'window': window, 'energy': energy if use_energy else None, 'exit_tolerance': exit_tolerance, 'length': min_length, 'mode': mode, 'chunk': chunk_size, 'jobs': jobs, 'disposal': disposal, 'analyze': bool(analyze_path), 'apply_map': bool(apply_map_path)},
+					'seconds': {'discovery': discovery_seconds, 'total': run_seconds},
+					'samples_per_second': totals['samples'] / run_seconds if run_seconds else None,
+					'totals': totals,
+					'files': reports
+				}, report_file, indent='\t')
+		except OSError:
+			if verbosity >= 1: print(f"\033[93mERROR: Failed to save report '{report_path}'!\033[0m")
+
+	if analyze_path:
+		map_file.close()
+		if verbosity >= 2:
+			if total_samples: print(f"{files_analyzed} files analyzed, {total_silence}/{total_samples} ({round(total_silence / total_samples * 100, 2)}%) samples of silence found.")
+			print(f"Silence map saved to {analyze_path}.")
+		exit()
+
+	if manifest_path and manifest is not None: save_manifest()
+
+	# let pipelines know the output is incomplete
+	if pipe and reports[0]['status'] == 'failed': exit(1)
+
+	if files_processed > 1:
+		if files_modified: print(f"{files_modified} out of {files_processed} files modified, {total_shrink}B total.")
+		else: print("No files were modified.")
 
-if len(files) > 1:
-	if files_modified: print(f"{files_modified} out of {len(files)} files modified, {total_shrink}B total.")
-	else: print("No files were modified.")
+	# let whatever runs the watch know it stopped because of an error
+	if watch_failed: exit(1)